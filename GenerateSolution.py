@@ -1,67 +1,288 @@
+import asyncio
 import dotenv
 import os
-from langchain_groq import ChatGroq
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 import time
 import pickle
+import threading
+from answer_cache import AnswerCache, known_diseases, prewarm
+from embedding_backends import backend_from_env, backend_id, make_embeddings, vectors_dir_from_env
+from llm_backends import make_llm
+from vector_index import IncrementalIndexer, index_backend
+from prompts import QUESTION, SYSTEM_PROMPT, USER_PROMPT
+from retrieval import HybridRetriever
+from telemetry import TELEMETRY
 
 dotenv.load_dotenv()
+
+
+class SolutionService:
+    """Answer (crop, disease) questions from a resident retriever and chain.
+
+    The prompt, document chain, FAISS store and HybridRetriever are built
+    once and reused. The files in vectors_dir are re-checked at most every
+    check_interval seconds and the retriever is rebuilt when they change. A
+    new one is swapped in under a lock, so answer() is safe to call from
+    several threads at once. Retrieved context is limited to the question's
+    crop and packed into token_budget tokens.
+
+    astream()/aanswer()/answer_many() are the asyncio counterparts: they
+    stream the answer as the LLM produces it and run many questions
+    concurrently. Retrieval itself runs in a worker thread.
+
+    The index must have been built by the same embedding backend as
+    `embeddings`; a mismatch raises instead of returning unrelated chunks.
+    """
+
+    def __init__(self, llm, embeddings, vectors_dir="Vectors", check_interval=2.0, token_budget=1500, k=6):
+        self.llm = llm
+        self.embeddings = embeddings
+        self.vectors_dir = vectors_dir
+        self.check_interval = check_interval
+        self.token_budget = token_budget
+        self.k = k
+
+        self.prompt = ChatPromptTemplate.from_messages([("system", SYSTEM_PROMPT), ("user", USER_PROMPT)])
+        self.document_chain = create_stuff_documents_chain(self.llm, self.prompt)
+
+        self.vector_store = None
+        self.hybrid_retriever = None
+        self.reloads = 0
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _files_signature(self):
+        """(name, mtime, size) of every index file, or None while the
+        directory is missing or changing (e.g. mid-swap in IncrementalIndexer.save)"""
+        signature = []
+        try:
+            for name in sorted(os.listdir(self.vectors_dir)):
+                st = os.stat(os.path.join(self.vectors_dir, name))
+                signature.append((name, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            return None
+        return tuple(signature)
+
+    def retriever(self):
+        """Current HybridRetriever, (re)loading the vector store if needed"""
+        now = time.monotonic()
+        if self.hybrid_retriever is not None and now - self._checked_at < self.check_interval:
+            return self.hybrid_retriever
+
+        with self._lock:
+            self._checked_at = now
+            signature = self._files_signature()
+            if signature is None and self.hybrid_retriever is not None:
+                # Index is being swapped; keep answering from the current one
+                return self.hybrid_retriever
+            if self.hybrid_retriever is None or signature != self._signature:
+                if hasattr(self.embeddings, "sync"):
+                    self.embeddings.sync(self.vectors_dir)
+                built_with, querying_with = index_backend(self.vectors_dir), backend_id(self.embeddings)
+                if built_with != querying_with:
+                    raise RuntimeError(f"{self.vectors_dir} was built with {built_with}, not {querying_with}")
+                vector_store = FAISS.load_local(self.vectors_dir, self.embeddings, allow_dangerous_deserialization=True)
+                retriever = HybridRetriever(vector_store, k=self.k, token_budget=self.token_budget)
+                self.vector_store, self.hybrid_retriever = vector_store, retriever
+                self._signature = signature
+                self.reloads += 1
+            return self.hybrid_retriever
+
+    def answer(self, crop, disease):
+        """Retrieve and answer; returns {"input", "context", "answer"} plus wall-clock seconds"""
+        retriever = self.retriever()
+        start_time = time.perf_counter()
+        question = QUESTION.format(crop, disease)
+        context = retriever.retrieve(question, crop, disease)
+        with TELEMETRY.span("llm", crop=crop, disease=disease):
+            answer = self.document_chain.invoke({"input": question, "context": context})
+        response = {"input": question, "context": context, "answer": answer}
+        return response, time.perf_counter() - start_time
+
+    async def _prepare(self, crop, disease):
+        retriever = await asyncio.to_thread(self.retriever)
+        question = QUESTION.format(crop, disease)
+        context = await asyncio.to_thread(retriever.retrieve, question, crop, disease)
+        return {"input": question, "context": context}
+
+    async def astream(self, crop, disease, inputs=None):
+        """Yield the answer text in chunks as the LLM streams it"""
+        inputs = inputs or await self._prepare(crop, disease)
+        async for chunk in self.document_chain.astream(inputs):
+            yield chunk
+
+    async def aanswer(self, crop, disease, timeout=None, on_token=None):
+        """Async answer(); on_token(text) is called for every streamed chunk.
+
+        The response also carries "first_token_seconds". Raises
+        asyncio.TimeoutError if the whole answer takes longer than timeout.
+        """
+        start_time = time.perf_counter()
+        response = {"first_token_seconds": None}
+
+        async def collect():
+            response.update(await self._prepare(crop, disease))
+            parts = []
+            async for chunk in self.astream(crop, disease, response):
+                if response["first_token_seconds"] is None:
+                    response["first_token_seconds"] = time.perf_counter() - start_time
+                parts.append(chunk)
+                if on_token is not None:
+                    on_token(chunk)
+            response["answer"] = "".join(parts)
+
+        await asyncio.wait_for(collect(), timeout)
+        seconds = time.perf_counter() - start_time
+        first_token_ms = round((response["first_token_seconds"] or 0) * 1000, 3)
+        TELEMETRY.record("llm", seconds, crop=crop, disease=disease, first_token_ms=first_token_ms)
+        return response, seconds
+
+    async def answer_many(self, pairs, concurrency=4, timeout=60.0):
+        """Answer (crop, disease) pairs with at most `concurrency` in flight.
+
+        Returns [(crop, disease, response or None, error or None)] in input
+        order; a question that times out or fails does not stop the others.
+        The timeout only counts time spent running, not waiting for a slot.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(crop, disease):
+            async with semaphore:
+                try:
+                    response, _ = await self.aanswer(crop, disease, timeout)
+                    return crop, disease, response, None
+                except Exception as e:
+                    return crop, disease, None, e
+
+        return await asyncio.gather(*(one(crop, disease) for crop, disease in pairs))
+
+
 class GenerateSolution:
-    def __init__(self):
-        os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
-        self.llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API"),
-            model="openai/gpt-oss-120b",
-            temperature=0
-        )
+    def __init__(self, llm=None):
+        if os.getenv("GOOGLE_API_KEY"):
+            os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+        # Any langchain chat model; MINORI_LLM=fake gives an offline deterministic one
+        self.llm = llm if llm is not None else make_llm(os.environ.get("MINORI_LLM", "groq"))
+        # "google" (remote) or "local" (offline TF-IDF + SVD); each has its own index
+        self.embedding_backend = backend_from_env()
+        self.vectors_dir = vectors_dir_from_env(self.embedding_backend)
+        self.service = None
+        self.answer_cache = AnswerCache(vectors_dir=self.vectors_dir)
 
     def generate(self, crop, disease): # Only for testing without context 
 
         question = f"Please tell the solution according to the official methods suggested by the government of India for the following crop and disease. Crop: {crop}, Disease: {disease}"
-        response = self.llm.invoke(question)
-        print(response.content)
+        for chunk in self.llm.stream(question):
+            print(chunk.content, end="", flush=True)
+        print()
 
     def process_documents(self):
         try:
-            self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-            if not os.path.exists("Vectors"):
-                loader = PyPDFDirectoryLoader("Data")
-                docs = loader.load()
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                final_documents = text_splitter.split_documents(docs[:])
-                self.vectors = FAISS.from_documents(final_documents, self.embeddings)
-                self.vectors.save_local("Vectors")
+            self.embeddings = make_embeddings(self.embedding_backend, self.vectors_dir)
+
+            # Only new or changed PDFs in Data/ are embedded
+            indexer = IncrementalIndexer(
+                self.embeddings,
+                vectors_dir=self.vectors_dir,
+                workers=int(os.environ["MINORI_INGEST_WORKERS"]) if os.environ.get("MINORI_INGEST_WORKERS") else None,
+                batch_size=int(os.environ.get("MINORI_EMBED_BATCH", "64")),
+            )
+            summary = indexer.update()
+            print(f"[INFO] Index update: {summary}")
                 
             return True
         except Exception as e:
             print(f"Error processing documents: {str(e)}")
             return False
         
-    def generate_with_context(self, crop, disease):
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an expert agriculture consultant. Use the provided context to answer the question accurately. If the context does not contain relevant information, respond with 'I don't know'."),
-            ("user", "Based on the following context, please provide information about the crop and disease. If the context does not contain relevant information, respond with 'I don't know'.\n\nContext: {context}\n\nQuestion: {input}")
-        ])
-        document_chain = create_stuff_documents_chain(self.llm, prompt)
-        vector_store = FAISS.load_local("Vectors", self.embeddings, allow_dangerous_deserialization=True)
-
-        retriever = vector_store.as_retriever()
-
-        retrieval_chain = create_retrieval_chain(retriever, document_chain)
-        questions = "Please tell the solution according to the official methods present in the context for the following crop and disease. Crop: {}, Disease: {}".format(crop, disease)
-        start_time = time.process_time()
-        self.response = retrieval_chain.invoke({'input': questions})
-        self.processing_time = time.process_time() - start_time
+    def get_service(self):
+        if self.service is None:
+            self.service = SolutionService(self.llm, self.embeddings, self.vectors_dir,
+                                           token_budget=int(os.environ.get("MINORI_CONTEXT_TOKENS", "1500")))
+        return self.service
+
+    def generate_with_context(self, crop, disease, use_cache=True):
+        start_time = time.perf_counter()
+        cached = self.answer_cache.get(crop, disease) if use_cache else None
+
+        if cached is not None:
+            self.response = {"input": QUESTION.format(crop, disease), "context": [], "answer": cached}
+            self.processing_time = time.perf_counter() - start_time
+        else:
+            self.response, self.processing_time = self.get_service().answer(crop, disease)
+            self.answer_cache.put(crop, disease, self.response["answer"])
 
         print("Answer:", self.response["answer"])
         print("Processing time:", self.processing_time, "seconds")
+        return self.response["answer"]
+
+    async def astream_with_context(self, crop, disease, use_cache=True):
+        """Async generate_with_context(): yields answer text as it is generated"""
+        cached = await asyncio.to_thread(self.answer_cache.get, crop, disease) if use_cache else None
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for chunk in self.get_service().astream(crop, disease):
+            parts.append(chunk)
+            yield chunk
+        await asyncio.to_thread(self.answer_cache.put, crop, disease, "".join(parts))
+
+    async def answer_many(self, pairs, concurrency=4, timeout=60.0, use_cache=True):
+        """{(crop, disease): answer text or exception}, answering uncached pairs concurrently"""
+        results = {}
+        for crop, disease in pairs:
+            cached = self.answer_cache.get(crop, disease) if use_cache else None
+            if cached is not None:
+                results[(crop, disease)] = cached
+
+        todo = [pair for pair in pairs if pair not in results]
+        for crop, disease, response, error in await self.get_service().answer_many(todo, concurrency, timeout):
+            if error is None:
+                self.answer_cache.put(crop, disease, response["answer"])
+            results[(crop, disease)] = response["answer"] if error is None else error
+        return results
+
+    def prewarm_cache(self, workers=4, force=False):
+        """Answer every known (crop, disease) label in parallel and cache it"""
+        service = self.get_service()
+        return prewarm(lambda crop, disease: service.answer(crop, disease)[0]["answer"],
+                       self.answer_cache, known_diseases(), workers, force)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate treatment advice from the indexed documents")
+    parser.add_argument("--prewarm", action="store_true", help="fill the answer cache for every known disease label")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--force", action="store_true", help="with --prewarm, regenerate cached answers too")
+    parser.add_argument("--llm", choices=["groq", "fake"], help="overrides MINORI_LLM")
+    parser.add_argument("--stream", action="store_true", help="print the answer as it is generated")
+    parser.add_argument("--all", action="store_true", help="answer every known disease label concurrently")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
 
-GS = GenerateSolution()
-if GS.process_documents():
-    GS.generate_with_context("wheat", "yellow rust")
\ No newline at end of file
+    GS = GenerateSolution(make_llm(args.llm) if args.llm else None)
+    if GS.process_documents():
+        if args.prewarm:
+            GS.prewarm_cache(args.workers, args.force)
+        elif args.all:
+            start = time.perf_counter()
+            results = asyncio.run(GS.answer_many(known_diseases(), args.concurrency, args.timeout, not args.force))
+            for (crop, disease), answer in results.items():
+                status = f"ERROR {answer!r}" if isinstance(answer, Exception) else f"{len(answer)} chars"
+                print(f"[INFO] {crop} / {disease}: {status}")
+            print(f"[INFO] {len(results)} answers in {time.perf_counter() - start:.2f} s")
+        elif args.stream:
+            async def stream():
+                async for chunk in GS.astream_with_context("wheat", "yellow rust"):
+                    print(chunk, end="", flush=True)
+                print()
+            asyncio.run(stream())
+        else:
+            GS.generate_with_context("wheat", "yellow rust")
\ No newline at end of file
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from prompts import prompt_hash
+
+
+CACHE_PATH = ".answer_cache.sqlite"
+
+
+def index_version(vectors_dir="Vectors"):
+    """Content hash of the files making up a vector index ("" if missing)"""
+    if not os.path.isdir(vectors_dir):
+        return ""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(vectors_dir)):
+        path = os.path.join(vectors_dir, name)
+        if not os.path.isfile(path):
+            continue
+        digest.update(name.encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class IndexVersion:
+    """index_version() that is only recomputed when the files' stat changes"""
+
+    def __init__(self, vectors_dir="Vectors"):
+        self.vectors_dir = vectors_dir
+        self._signature = None
+        self._version = ""
+
+    def get(self):
+        signature = None
+        if os.path.isdir(self.vectors_dir):
+            signature = tuple(
+                (name, st.st_mtime_ns, st.st_size)
+                for name in sorted(os.listdir(self.vectors_dir))
+                for st in [os.stat(os.path.join(self.vectors_dir, name))]
+            )
+        if signature != self._signature:
+            self._signature = signature
+            self._version = index_version(self.vectors_dir)
+        return self._version
+
+
+def normalize(text):
+    return " ".join(str(text).replace("_", " ").split()).lower()
+
+
+class AnswerCache:
+    """On-disk cache of treatment advice per (crop, disease).
+
+    Entries are keyed by (crop, disease, prompt template hash, index
+    version), so changing a prompt or rebuilding Vectors/ never serves an
+    answer produced under different inputs. Entries older than ttl_seconds
+    are ignored and removed; beyond max_entries the least recently read
+    entries are evicted. Backed by SQLite, so it is safe to share between
+    threads and processes; timeout is how long to wait for another writer.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=30 * 24 * 3600, max_entries=1000, vectors_dir="Vectors",
+                 timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.prompt_hash = prompt_hash()
+        self.index = IndexVersion(vectors_dir)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    crop TEXT, disease TEXT, prompt_hash TEXT, index_version TEXT,
+                    answer TEXT, created REAL, accessed REAL,
+                    PRIMARY KEY (crop, disease, prompt_hash, index_version)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _key(self, crop, disease):
+        return (normalize(crop), normalize(disease), self.prompt_hash, self.index.get())
+
+    def get(self, crop, disease):
+        """Cached answer text, or None"""
+        key = self._key(crop, disease)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT answer, created FROM answers WHERE crop=? AND disease=? AND prompt_hash=? AND index_version=?",
+                key,
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    db.execute("DELETE FROM answers WHERE crop=? AND disease=? AND prompt_hash=? AND index_version=?", key)
+                self.misses += 1
+                return None
+
+            db.execute(
+                "UPDATE answers SET accessed=? WHERE crop=? AND disease=? AND prompt_hash=? AND index_version=?",
+                (now,) + key,
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(self, crop, disease, answer):
+        key = self._key(crop, disease)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)", key + (answer, now, now))
+            db.execute(
+                "DELETE FROM answers WHERE rowid IN ("
+                " SELECT rowid FROM answers ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def purge_expired(self):
+        with self._lock, self._connect() as db:
+            return db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl_seconds,)).rowcount
+
+    def __len__(self):
+        with self._lock, self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+def known_diseases(root="."):
+    """(crop, disease) for every non-healthy class label of every crop model"""
+    import pickle
+    from crop_models import discover_crops
+
+    pairs = []
+    for crop, spec in discover_crops(root).items():
+        with open(spec.classes_path, "rb") as f:
+            labels = list(pickle.load(f))
+        pairs.extend((crop, label) for label in labels if "healthy" not in label.lower())
+    return pairs
+
+
+def prewarm(answer_fn, cache, pairs, workers=4, force=False):
+    """Fill cache by calling answer_fn(crop, disease) for every pair in parallel"""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    todo = [(c, d) for c, d in pairs if force or cache.get(c, d) is None]
+    print(f"[INFO] Pre-warming {len(todo)} of {len(pairs)} answers with {workers} workers")
+
+    failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(answer_fn, crop, disease): (crop, disease) for crop, disease in todo}
+        for future in as_completed(futures):
+            crop, disease = futures[future]
+            try:
+                cache.put(crop, disease, future.result())
+                print(f"[INFO] Cached {crop} / {disease}")
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {crop} / {disease}: {e}")
+
+    print(f"[INFO] Pre-warm done in {time.perf_counter() - start:.1f} s, {failed} failed")
+    return len(todo) - failed
+
@@ -0,0 +1,278 @@
+import csv
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from preprocess import FramePreprocessor, load_frame
+from telemetry import TELEMETRY
+from tflite_backend import IMAGE_PATTERNS
+
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm")
+IMAGE_EXTENSIONS = tuple(pattern[1:] for pattern in IMAGE_PATTERNS)
+
+
+def is_video(path):
+    return os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def iter_images(source):
+    """Image paths under a directory (recursively, sorted) or matching a glob"""
+    if os.path.isdir(source):
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(dirpath, name)
+    elif os.path.isfile(source):
+        yield source
+    else:
+        for path in glob.iglob(source, recursive=True):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+
+
+def iter_video(path, stride=1, done=()):
+    """(key, loader) for every stride-th frame; frames in done are skipped undecoded"""
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    try:
+        index = 0
+        while True:
+            key = f"{path}#frame={index}"
+            if index % stride or key in done:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield key, (lambda frame=frame: frame)
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_inputs(source, stride=1, done=()):
+    """(key, loader) pairs for a directory, glob, image or video file"""
+    if is_video(source):
+        yield from iter_video(source, stride, done)
+        return
+    for path in iter_images(source):
+        if path not in done:
+            yield path, (lambda path=path: load_frame(path))
+
+
+def prefetch(items, target_size, workers=4, depth=256):
+    """Yield (key, (H, W, 3) float32 input or exception) in input order.
+
+    A feeder thread walks items and hands decoding and resizing to a thread
+    pool (OpenCV releases the GIL); at most `depth` results are buffered,
+    so memory stays bounded however many inputs there are.
+    """
+    local = threading.local()
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def prepare(load):
+        if not hasattr(local, "preprocessor"):
+            local.preprocessor = FramePreprocessor(target_size)
+        h, w = target_size
+        return local.preprocessor.preprocess_into(load(), np.empty((h, w, 3), dtype=np.float32))
+
+    def feed(pool):
+        try:
+            for key, load in items:
+                if stop.is_set():
+                    break
+                pending.put((key, pool.submit(prepare, load)))
+        except Exception as e:
+            pending.put((None, e))
+        pending.put(done)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="minori-decode") as pool:
+        feeder = threading.Thread(target=feed, args=(pool,), daemon=True)
+        feeder.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is done:
+                    break
+                key, future = item
+                if key is None:
+                    raise future
+                try:
+                    yield key, future.result()
+                except Exception as e:
+                    yield key, e
+        finally:
+            stop.set()
+            # Unblock the feeder if it is waiting on a full queue
+            while feeder.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+class ResultWriter():
+    """Append per-input results to a .jsonl or .csv file, flushed every batch.
+
+    On open, an existing file is read back to learn which inputs are done
+    (a torn last line from an interrupted run is cut off), so a rerun
+    resumes where the previous one stopped. Inputs that failed are retried.
+    """
+
+    def __init__(self, path, class_labels, overwrite=False):
+        self.path = path
+        self.class_labels = class_labels
+        self.format = "csv" if path.lower().endswith(".csv") else "jsonl"
+        self.done = set() if overwrite else self._read_done()
+
+        self._file = open(path, "w" if overwrite else "a", newline="", encoding="utf-8")
+        if self.format == "csv":
+            self._csv = csv.writer(self._file)
+            if self._file.tell() == 0:
+                self._csv.writerow(["input", "label", "confidence", "error"] + list(class_labels))
+
+    def _read_done(self):
+        if not os.path.exists(self.path):
+            return set()
+
+        done, good_bytes = set(), 0
+        with open(self.path, "rb") as f:
+            for i, line in enumerate(f):
+                if not line.endswith(b"\n"):
+                    break
+                text = line.decode("utf-8")
+                if self.format == "csv":
+                    row = next(csv.reader([text]))
+                    if i > 0 and not row[3]:
+                        done.add(row[0])
+                else:
+                    try:
+                        record = json.loads(text)
+                    except ValueError:
+                        break
+                    if not record.get("error"):
+                        done.add(record["input"])
+                good_bytes += len(line)
+
+        if good_bytes < os.path.getsize(self.path):
+            print(f"[WARN] Dropping a partial record at the end of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(good_bytes)
+        return done
+
+    def write(self, key, probs=None, error=None):
+        if probs is not None:
+            best = int(np.argmax(probs))
+            label, confidence = self.class_labels[best], float(probs[best])
+        else:
+            label, confidence = "", None
+
+        if self.format == "csv":
+            values = [f"{p:.6f}" for p in probs] if probs is not None else [""] * len(self.class_labels)
+            self._csv.writerow([key, label, "" if confidence is None else f"{confidence:.6f}", error or ""] + values)
+        else:
+            record = {"input": key, "label": label, "confidence": confidence}
+            if probs is not None:
+                record["probs"] = {name: round(float(p), 6) for name, p in zip(self.class_labels, probs)}
+            if error:
+                record["error"] = error
+            self._file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(detector, source, output, batch_size=64, workers=4, prefetch_batches=4,
+              stride=1, overwrite=False, report_every=5.0):
+    """Classify every input in source with detector, streaming results to output"""
+    writer = ResultWriter(output, detector.class_labels, overwrite)
+    if writer.done:
+        print(f"[INFO] Resuming: {len(writer.done)} inputs already in {output}")
+
+    h, w = detector.preprocessor.target_size
+    batch = np.empty((batch_size, h, w, 3), dtype=np.float32)
+    keys = []
+    processed = failed = 0
+    start = last_report = time.perf_counter()
+
+    def flush_batch():
+        if keys:
+            with TELEMETRY.span("inference", crop=detector.crop, batch=len(keys)):
+                probs = detector.engine.predict_batch(batch[:len(keys)])
+            for key, probs in zip(keys, probs):
+                writer.write(key, probs)
+            keys.clear()
+        writer.flush()
+
+    items = iter_inputs(source, stride, writer.done)
+    try:
+        for key, value in prefetch(items, (h, w), workers, prefetch_batches * batch_size):
+            if isinstance(value, Exception):
+                writer.write(key, error=str(value))
+                failed += 1
+                continue
+
+            batch[len(keys)] = value
+            keys.append(key)
+            if len(keys) == batch_size:
+                processed += batch_size
+                flush_batch()
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                last_report = now
+                print(f"[INFO] {processed} images, {failed} failed, {processed / (now - start):.1f} img/s")
+        processed += len(keys)
+        flush_batch()
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - start
+    summary = {
+        "processed": processed,
+        "failed": failed,
+        "skipped": len(writer.done),
+        "seconds": seconds,
+        "images_per_second": processed / seconds if seconds else 0.0,
+    }
+    print(f"[INFO] Done: {processed} images in {seconds:.1f} s ({summary['images_per_second']:.1f} img/s), "
+          f"{failed} failed, {summary['skipped']} skipped")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    from crop_models import CropDetector, crop_spec
+
+    parser = argparse.ArgumentParser(description="Classify a folder, glob or video of leaf images without the GUI")
+    parser.add_argument("crop")
+    parser.add_argument("source", help="directory, glob pattern (quote it), image or video file")
+    parser.add_argument("--output", default="results.jsonl", help=".jsonl or .csv; an existing file is resumed")
+    parser.add_argument("--overwrite", action="store_true", help="start over instead of resuming")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--prefetch", type=int, default=4, help="batches decoded ahead of the model")
+    parser.add_argument("--stride", type=int, default=1, help="for videos, classify every n-th frame")
+    parser.add_argument("--backend", default="keras", help="keras or tflite-<variant>")
+    parser.add_argument("--threads", type=int, help="TFLite interpreter threads")
+    args = parser.parse_args()
+
+    detector = CropDetector(crop_spec(args.crop), backend=args.backend, num_threads=args.threads)
+    run_batch(detector, args.source, args.output, args.batch_size, args.workers, args.prefetch,
+              args.stride, args.overwrite)
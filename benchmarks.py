@@ -0,0 +1,304 @@
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+SUITES = ("detection", "render", "rag")
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+FRAME_SIZE = (480, 640)
+DISPLAY_SIZE = (780, 520)
+
+# A metric regresses when its p50 grows by more than this fraction of the
+# baseline and by more than MIN_DELTA_MS (so scheduler jitter is ignored)
+THRESHOLDS = {"detection": 0.30, "render": 0.30, "rag": 0.30}
+MIN_DELTA_MS = 0.5
+
+
+def measure(fn, repeats=50, warmup=5, items=1):
+    """Latency percentiles of fn() in ms, plus items/s at the median"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples = np.asarray(samples) * 1000
+    p50, p95 = np.percentile(samples, (50, 95))
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "mean_ms": float(samples.mean()),
+            "repeats": repeats, "items_per_second": float(items * 1000 / p50) if p50 else 0.0}
+
+
+def synthetic_frames(n, seed=0, size=FRAME_SIZE):
+    """n reproducible BGR camera-sized frames (smooth noise, so resizes are realistic)"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    h, w = size
+    small = rng.integers(0, 256, (n, h // 8, w // 8, 3), dtype=np.uint8)
+    return [cv2.resize(s, (w, h), interpolation=cv2.INTER_LINEAR) for s in small]
+
+
+def synthetic_model(num_classes, input_shape=(128, 128, 3), seed=0):
+    """Untrained Keras CNN with the detectors' 128x128x3 input and softmax output"""
+    from startup import import_tensorflow
+    tf = import_tensorflow()
+
+    tf.keras.utils.set_random_seed(seed)
+    layers = tf.keras.layers
+    return tf.keras.Sequential([
+        tf.keras.Input(input_shape),
+        layers.Conv2D(32, 3, activation="relu"),
+        layers.MaxPooling2D(),
+        layers.Conv2D(64, 3, activation="relu"),
+        layers.MaxPooling2D(),
+        layers.Conv2D(128, 3, activation="relu"),
+        layers.MaxPooling2D(),
+        layers.Flatten(),
+        layers.Dense(128, activation="relu"),
+        layers.Dense(num_classes, activation="softmax"),
+    ])
+
+
+def crop_classes(root="."):
+    """{crop: class count} from the committed class index files"""
+    import pickle
+    from crop_models import discover_crops
+
+    classes = {}
+    for crop, spec in discover_crops(root).items():
+        with open(spec.classes_path, "rb") as f:
+            classes[crop] = len(pickle.load(f))
+    return classes
+
+
+def bench_detection(batch_sizes=BATCH_SIZES, repeats=30, seed=0):
+    """Preprocessing per batch size, then InferenceEngine latency per crop and batch size"""
+    from inference_engine import InferenceEngine
+    from preprocess import FramePreprocessor
+
+    frames = synthetic_frames(max(batch_sizes), seed)
+    preprocessor = FramePreprocessor()
+    out = np.empty((max(batch_sizes),) + preprocessor.target_size + (3,), dtype=np.float32)
+    # Timed before any model exists: TensorFlow's idle worker threads spin
+    # for a while after each call and would skew these on a small machine
+    results = {f"detection/preprocess/b{n}": measure(
+        lambda: preprocessor.preprocess_batch(frames[:n], out), repeats * 4, items=n) for n in batch_sizes}
+
+    for crop, num_classes in crop_classes().items():
+        engine = InferenceEngine(synthetic_model(num_classes, seed=seed), name=f"synthetic {crop}")
+        for n in batch_sizes:
+            batch = preprocessor.preprocess_batch(frames[:n], out)
+            results[f"detection/{crop}/inference/b{n}"] = measure(
+                lambda: engine.predict_batch(batch), repeats, items=n)
+        print(f"[INFO] detection {crop}: " + ", ".join(
+            f"b{n} {results[f'detection/{crop}/inference/b{n}']['p50_ms']:.2f} ms" for n in batch_sizes))
+    return results
+
+
+class _HeadlessLabel():
+    """Stands in for the Tk preview label"""
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def configure(self, **kwargs):
+        pass
+
+
+class _HeadlessPhoto():
+    """Stands in for ImageTk.PhotoImage; paste() is the Tk copy we cannot time headless"""
+
+    def paste(self, img):
+        pass
+
+
+def bench_render(repeats=200, seed=0):
+    """Preview rendering without a display: overlay drawing and FrameRenderer.render"""
+    from renderer import FrameRenderer, draw_detection_overlay
+
+    frame = synthetic_frames(1, seed)[0]
+    fh, fw = frame.shape[:2]
+    results = {"render/draw_detection_overlay": measure(
+        lambda: draw_detection_overlay(frame.copy(), False), repeats)}
+
+    for name, size in (("native", (fw, fh)), ("scaled", DISPLAY_SIZE)):
+        renderer = FrameRenderer(_HeadlessLabel())
+        renderer.target_size = size
+        renderer._photo, renderer._photo_size = _HeadlessPhoto(), size
+        results[f"render/frame/{name}"] = measure(lambda: renderer.render(frame), repeats)
+        results[f"render/frame_overlay/{name}"] = measure(lambda: renderer.render(frame, False), repeats)
+    print("[INFO] render: " + ", ".join(f"{k.split('/', 1)[1]} {v['p50_ms']:.2f} ms" for k, v in results.items()))
+    return results
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic query embeddings matching an existing index's dimension.
+
+    Vectors are seeded from a hash of the text, so retrieval is repeatable
+    and nothing is sent to an embedding API. It reports the backend id of
+    the index it is benchmarked against, which SolutionService checks.
+    """
+
+    def __init__(self, dim, backend_id):
+        self.dim = dim
+        self.backend_id = backend_id
+
+    def embed_query(self, text):
+        import hashlib
+
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def bench_rag(vectors_dir="Vectors", repeats=20):
+    """FAISS load, hybrid retrieval and a full answer with a stub LLM"""
+    import faiss
+    from answer_cache import known_diseases
+    from GenerateSolution import SolutionService
+    from langchain_community.vectorstores import FAISS
+    from llm_backends import FakeAdvisorLLM
+    from prompts import QUESTION
+    from retrieval import HybridRetriever
+    from vector_index import index_backend
+
+    dim = faiss.read_index(os.path.join(vectors_dir, "index.faiss")).d
+    embeddings = StubEmbeddings(dim, index_backend(vectors_dir))
+    pairs = known_diseases() or [("Rice", "Leaf Blast")]
+
+    def load():
+        return FAISS.load_local(vectors_dir, embeddings, allow_dangerous_deserialization=True)
+
+    store = load()
+    results = {
+        "rag/faiss_load": measure(load, max(3, repeats // 4), warmup=1),
+        "rag/retriever_build": measure(lambda: HybridRetriever(store), max(3, repeats // 4), warmup=1),
+    }
+
+    retriever = HybridRetriever(store)
+    questions = [(QUESTION.format(crop, disease), crop, disease) for crop, disease in pairs]
+    results["rag/retrieve"] = measure(
+        lambda: [retriever.retrieve(*q) for q in questions], repeats, items=len(questions))
+
+    service = SolutionService(FakeAdvisorLLM(), embeddings, vectors_dir, check_interval=3600)
+    results["rag/answer"] = measure(
+        lambda: [service.answer(crop, disease) for crop, disease in pairs], repeats, items=len(pairs))
+    for key in ("rag/retrieve", "rag/answer"):
+        results[key]["per_question_ms"] = results[key]["p50_ms"] / len(questions)
+    print("[INFO] rag: " + ", ".join(f"{k.split('/', 1)[1]} {v['p50_ms']:.2f} ms" for k, v in results.items()))
+    return results
+
+
+def environment(threads=None):
+    info = {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpu_count": os.cpu_count(), "threads": threads}
+    for module in ("numpy", "cv2", "tensorflow", "faiss"):
+        if module in sys.modules:
+            info[module] = getattr(sys.modules[module], "__version__", None)
+    return info
+
+
+def compare(results, baseline, thresholds=THRESHOLDS, min_delta_ms=MIN_DELTA_MS):
+    """Per-metric p50 change against a baseline run, flagging regressions"""
+    metrics, regressions, improvements = {}, [], []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        threshold = thresholds.get(name.split("/", 1)[0], 0.30)
+        base_ms, now_ms = before["p50_ms"], current["p50_ms"]
+        ratio = now_ms / base_ms if base_ms else float("inf")
+        status = "ok"
+        if ratio > 1 + threshold and now_ms - base_ms > min_delta_ms:
+            status = "regression"
+            regressions.append(name)
+        elif ratio < 1 - threshold and base_ms - now_ms > min_delta_ms:
+            status = "improvement"
+            improvements.append(name)
+        metrics[name] = {"baseline_ms": base_ms, "current_ms": now_ms, "ratio": ratio,
+                         "threshold": threshold, "status": status}
+    return {"metrics": metrics, "regressions": regressions, "improvements": improvements,
+            "missing": sorted(set(baseline.get("results", {})) - set(results))}
+
+
+def run(suites=SUITES, batch_sizes=BATCH_SIZES, repeats=None, seed=0, threads=None):
+    """{"environment", "config", "results"} for the selected suites"""
+    import cv2
+
+    if threads:
+        cv2.setNumThreads(threads)
+        if "detection" in suites:
+            from startup import import_tensorflow
+            tf = import_tensorflow()
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    started = time.time()
+    results = {}
+    if "detection" in suites:
+        results.update(bench_detection(batch_sizes, repeats or 30, seed))
+    if "render" in suites:
+        results.update(bench_render(repeats or 200, seed))
+    if "rag" in suites:
+        results.update(bench_rag(repeats=repeats or 20))
+    return {
+        "timestamp": round(started, 3),
+        "seconds": time.time() - started,
+        "environment": environment(threads),
+        "config": {"suites": list(suites), "batch_sizes": list(batch_sizes), "repeats": repeats, "seed": seed},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline CPU benchmarks for detection, rendering and RAG")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma-separated, from {', '.join(SUITES)}")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--repeats", type=int, help="timed runs per metric (default depends on the suite)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, help="pin OpenCV and TensorFlow thread pools")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against; exit 1 on a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    parser.add_argument("--threshold", type=float, help="override every suite's regression threshold")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = [s for s in suites if s not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites {unknown}, expected some of {SUITES}")
+
+    report = run(suites, tuple(int(n) for n in args.batch_sizes.split(",")), args.repeats, args.seed, args.threads)
+    regressed = False
+    if args.baseline and not args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            thresholds = {s: args.threshold for s in SUITES} if args.threshold is not None else THRESHOLDS
+            report["comparison"] = dict(compare(report["results"], baseline, thresholds), baseline=args.baseline)
+            for name in report["comparison"]["regressions"]:
+                m = report["comparison"]["metrics"][name]
+                print(f"[WARN] Regression: {name} {m['baseline_ms']:.2f} -> {m['current_ms']:.2f} ms "
+                      f"(x{m['ratio']:.2f}, threshold +{m['threshold']:.0%})")
+            regressed = bool(report["comparison"]["regressions"])
+        else:
+            print(f"[WARN] No baseline at {args.baseline}; run with --save-baseline to create one")
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in filter(None, (args.output, args.baseline if args.save_baseline else None)):
+        with open(path, "w") as f:
+            f.write(text + "\n")
+        print(f"[INFO] Wrote {path}")
+    sys.exit(1 if regressed else 0)
@@ -0,0 +1,316 @@
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from telemetry import TELEMETRY
+
+
+FramePacket = namedtuple("FramePacket", ["frame", "timestamp", "seq"])
+
+
+class FrameSource():
+    """Anything that produces BGR frames: a camera, a video file, a generator.
+
+    Subclasses implement open(), read() and release(). read() may fill the
+    array passed as `out` to avoid an allocation, but it is free to return
+    a different array instead.
+    """
+
+    name = "source"
+
+    def open(self):
+        raise NotImplementedError
+
+    def read(self, out=None):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class DeviceSource(FrameSource):
+    """A local camera, trying each device index in turn"""
+
+    def __init__(self, indices=(1, 0), width=640, height=480):
+        self.indices = indices
+        self.width = width
+        self.height = height
+        self.cap = None
+        self.name = f"camera {indices}"
+
+    def open(self):
+        self.release()
+        for index in self.indices:
+            cap = cv2.VideoCapture(index)
+            if cap.isOpened():
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                self.cap = cap
+                self.name = f"camera {index}"
+                return True
+            cap.release()
+        return False
+
+    def read(self, out=None):
+        if self.cap is None:
+            return False, None
+        return self.cap.read(out)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class VideoFileSource(FrameSource):
+    """Play a video file as if it were a live camera"""
+
+    def __init__(self, path, loop=True, realtime=True):
+        self.path = str(path)
+        self.loop = loop
+        self.realtime = realtime
+        self.cap = None
+        self.name = f"file {self.path}"
+        self._interval = 0.0
+        self._next_time = 0.0
+
+    def open(self):
+        self.release()
+        cap = cv2.VideoCapture(self.path)
+        if not cap.isOpened():
+            return False
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self._interval = 1.0 / fps if self.realtime and fps and fps > 0 else 0.0
+        self._next_time = time.perf_counter()
+        self.cap = cap
+        return True
+
+    def read(self, out=None):
+        if self.cap is None:
+            return False, None
+
+        if self._interval:
+            delay = self._next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time = max(self._next_time + self._interval, time.perf_counter())
+
+        ret, frame = self.cap.read(out)
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(out)
+        return ret, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class SyntheticSource(FrameSource):
+    """Generate frames in-process, for tests and benchmarks.
+
+    `generator` is called with the frame number and must return a BGR
+    array; by default a moving gradient is drawn. `fail_after` makes the
+    source drop out after that many frames, to exercise reconnection.
+    """
+
+    def __init__(self, width=640, height=480, fps=30.0, generator=None, fail_after=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.generator = generator or self._gradient
+        self.fail_after = fail_after
+        self.name = "synthetic"
+        self.opened = False
+        self.opens = 0
+        self._count = 0
+        self._next_time = 0.0
+
+    def open(self):
+        self.opened = True
+        self.opens += 1
+        self._count = 0
+        self._next_time = time.perf_counter()
+        return True
+
+    def read(self, out=None):
+        if not self.opened:
+            return False, None
+        if self.fail_after is not None and self._count >= self.fail_after:
+            return False, None
+
+        if self.fps:
+            delay = self._next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time = max(self._next_time + 1.0 / self.fps, time.perf_counter())
+
+        frame = self.generator(self._count)
+        self._count += 1
+        if out is not None and out.shape == frame.shape:
+            out[...] = frame
+            return True, out
+        return True, frame
+
+    def release(self):
+        self.opened = False
+
+    def _gradient(self, n):
+        x = (np.arange(self.width, dtype=np.uint16) + n * 4) % 256
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        frame[...] = x.astype(np.uint8)[None, :, None]
+        return frame
+
+
+class FrameRing():
+    """Fixed ring of frame buffers holding the most recent captures.
+
+    The writer fills the next buffer in place while readers keep using the
+    previous one, so a reader that holds a frame for less than
+    (size - 1) capture intervals never sees it change underneath it.
+    Anything kept longer must be copied.
+    """
+
+    def __init__(self, size=3):
+        self.size = size
+        self._buffers = [None] * size
+        self._packets = [None] * size
+        self._index = -1
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    def next_buffer(self):
+        """Buffer the writer should fill next (None until the first frame)"""
+        return self._buffers[(self._index + 1) % self.size]
+
+    def publish(self, frame, timestamp):
+        with self._cond:
+            index = (self._index + 1) % self.size
+            self._buffers[index] = frame
+            self._seq += 1
+            self._packets[index] = FramePacket(frame, timestamp, self._seq)
+            self._index = index
+            self._cond.notify_all()
+
+    def latest(self):
+        with self._cond:
+            if self._index < 0:
+                return None
+            return self._packets[self._index]
+
+    def wait_newer(self, seq, timeout=None):
+        """Block until a frame newer than `seq` arrives (or timeout)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            if self._index < 0:
+                return None
+            packet = self._packets[self._index]
+            return packet if packet.seq > seq else None
+
+
+class CameraGrabber():
+    """Read a FrameSource continuously on its own thread.
+
+    Consumers call latest() to get the newest FramePacket without ever
+    blocking on the device. When the source stops delivering frames it is
+    released and re-opened with exponential backoff.
+    """
+
+    def __init__(self, source, ring_size=3, max_failures=5,
+                 reconnect_delay=0.5, max_reconnect_delay=5.0):
+        self.source = source
+        self.ring = FrameRing(ring_size)
+        self.max_failures = max_failures
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.connected = False
+        self.frames = 0
+        self.reconnects = 0
+        self.fps = 0.0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="minori-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.source.release()
+        self.connected = False
+
+    def latest(self):
+        """Newest FramePacket, or None before the first frame"""
+        return self.ring.latest()
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        return self.ring.wait_newer(after_seq, timeout)
+
+    def stats(self):
+        return {
+            "source": self.source.name,
+            "connected": self.connected,
+            "frames": self.frames,
+            "reconnects": self.reconnects,
+            "fps": self.fps,
+        }
+
+    def _connect(self):
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                if self.source.open():
+                    print(f"[INFO] Camera connected: {self.source.name}")
+                    return True
+            except Exception as e:
+                print(f"[ERROR] Opening {self.source.name}: {e}")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._connect():
+                break
+            self.connected = True
+
+            failures = 0
+            window_start = time.perf_counter()
+            window_frames = 0
+            while not self._stop.is_set() and failures < self.max_failures:
+                with TELEMETRY.span("capture"):
+                    ret, frame = self.source.read(self.ring.next_buffer())
+                if not ret or frame is None:
+                    failures += 1
+                    self._stop.wait(0.01)
+                    continue
+
+                failures = 0
+                self.ring.publish(frame, time.time())
+                self.frames += 1
+
+                # Capture rate for the UI, refreshed about once a second
+                window_frames += 1
+                elapsed = time.perf_counter() - window_start
+                if elapsed >= 1.0:
+                    self.fps = window_frames / elapsed
+                    window_start += elapsed
+                    window_frames = 0
+
+            self.connected = False
+            self.source.release()
+            if not self._stop.is_set():
+                self.reconnects += 1
+                print(f"[WARN] Camera {self.source.name} dropped, reconnecting...")
@@ -0,0 +1,308 @@
+import os
+os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
+
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from inference_engine import InferenceEngine
+from model_cache import file_version, load_model_cached
+from prediction_cache import PredictionCache
+from preprocess import FramePreprocessor, as_frame
+from telemetry import TELEMETRY
+
+
+MODEL_DIR_SUFFIX = " Disease Model and Classes"
+
+CropModelSpec = namedtuple("CropModelSpec", ["crop", "directory", "model_path", "classes_path"])
+
+
+def discover_crops(root="."):
+    """Find every `<Crop> Disease Model and Classes/` directory under root.
+
+    Each directory is expected to hold `<crop>_disease_model.h5` and
+    `<crop>_class_indices.pkl`; adding a crop is just adding a directory.
+    """
+    specs = OrderedDict()
+    for name in sorted(os.listdir(root)):
+        directory = os.path.join(root, name)
+        if not (name.endswith(MODEL_DIR_SUFFIX) and os.path.isdir(directory)):
+            continue
+
+        crop = name[:-len(MODEL_DIR_SUFFIX)]
+        slug = crop.lower().replace(" ", "_")
+        classes_path = os.path.join(directory, f"{slug}_class_indices.pkl")
+        if not os.path.exists(classes_path):
+            continue
+
+        model_path = os.path.join(directory, f"{slug}_disease_model.h5")
+        specs[crop] = CropModelSpec(crop, directory, model_path, classes_path)
+    return specs
+
+
+def parse_backends(text):
+    """Parse "Rice=tflite-int8,Wheat=keras" into {"Rice": "tflite-int8", ...}"""
+    backends = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            crop, backend = item.split("=", 1)
+            backends[crop.strip()] = backend.strip()
+    return backends
+
+
+def crop_spec(crop, root="."):
+    specs = discover_crops(root)
+    if crop not in specs:
+        raise KeyError(f"No model directory for crop '{crop}' (looked for '{crop}{MODEL_DIR_SUFFIX}')")
+    return specs[crop]
+
+
+class CropDetector():
+    """Disease classifier for one crop: model, labels and preprocessing.
+
+    backend is "keras" (the .h5 model through InferenceEngine) or
+    "tflite-<variant>" for a quantized export made with tflite_backend.py;
+    both expose the same predict/predict_batch API.
+    """
+
+    def __init__(self, spec, use_cache=None, backend="keras", num_threads=None):
+        if use_cache is None:
+            use_cache = os.getenv("MINORI_MODEL_CACHE", "1") != "0"
+
+        self.spec = spec
+        self.crop = spec.crop
+        self.backend = backend
+
+        with open(spec.classes_path, "rb") as f:
+            class_indices = pickle.load(f)
+
+        # Order labels by class index, as the model outputs them
+        self.class_labels = [label for label, _ in sorted(class_indices.items(), key=lambda item: item[1])]
+        self.preprocessor = FramePreprocessor()
+        self._lock = threading.Lock()
+        self._batch_buffer = None
+
+        # Optional PredictionCache, shared between crops by the registry
+        self.cache = None
+
+        if backend == "keras":
+            self.model_file = spec.model_path
+            self.version = file_version(self.model_file)
+            self.model = load_model_cached(spec.model_path, use_cache=use_cache)
+            # Traced once and warmed up here rather than on the first "Detect Now"
+            self.engine = InferenceEngine(self.model, name=self.crop)
+        elif backend.startswith("tflite-"):
+            from tflite_backend import TFLiteEngine, tflite_path
+            self.model_file = tflite_path(spec, backend[len("tflite-"):])
+            self.version = file_version(self.model_file)
+            self.engine = self.model = TFLiteEngine(self.model_file, num_threads, name=self.crop)
+        else:
+            raise ValueError(f"Unknown backend '{backend}' for {self.crop}")
+
+        self._checked_at = time.monotonic()
+        self._stale = False
+
+    def memory_bytes(self):
+        """Rough resident size of the model weights"""
+        return int(self.model.count_params()) * 4
+
+    def is_stale(self, check_interval=1.0):
+        """True once the model file on disk differs from the one loaded"""
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at >= check_interval:
+            self._checked_at = now
+            try:
+                self._stale = file_version(self.model_file) != self.version
+            except OSError:
+                self._stale = False
+        return self._stale
+
+    def predict(self, frame):
+        """Class probabilities for a BGR frame (ndarray) or an image file path"""
+        # The preprocessor's input buffer is shared, so one call at a time
+        with self._lock:
+            with TELEMETRY.span("preprocess", crop=self.crop):
+                img_array = self.preprocessor.preprocess(as_frame(frame))
+            if self.cache is None:
+                with TELEMETRY.span("inference", crop=self.crop, backend=self.backend):
+                    return self.engine.predict_one(img_array)
+
+            image_hash = self.cache.hash(img_array)
+            probs = self.cache.get(self.crop, self.version, image_hash)
+            if probs is None:
+                with TELEMETRY.span("inference", crop=self.crop, backend=self.backend):
+                    probs = self.engine.predict_one(img_array)
+                self.cache.put(self.crop, self.version, image_hash, probs)
+            return probs
+
+    def predict_batch(self, frames):
+        """Class probabilities for several frames at once, shape (N, C)"""
+        with self._lock:
+            with TELEMETRY.span("preprocess", crop=self.crop, batch=len(frames)):
+                batch = self.preprocessor.preprocess_batch([as_frame(f) for f in frames], self._batch_buffer)
+            if self._batch_buffer is None or len(batch) > len(self._batch_buffer):
+                self._batch_buffer = batch
+            with TELEMETRY.span("inference", crop=self.crop, backend=self.backend, batch=len(frames)):
+                return self.engine.predict_batch(batch)
+
+    def classify(self, frame):
+        """(label, {label: probability}) for a frame"""
+        prediction = self.predict(frame)
+        with TELEMETRY.span("postprocess", crop=self.crop):
+            label = self.class_labels[int(np.argmax(prediction))]
+            return label, dict(zip(self.class_labels, prediction.tolist()))
+
+    def detect(self, frame):
+        """Most likely class label for a frame"""
+        predicted_class, _ = self.classify(frame)
+
+        print("Predicted:", predicted_class)
+        return predicted_class
+
+
+class CropModelRegistry():
+    """Load crop models on demand and keep them within a memory budget.
+
+    get() loads a model the first time a crop is used; prefetch() starts that
+    load in the background (e.g. when the crop selection changes). When the
+    loaded models exceed memory_budget_mb, the least recently used ones are
+    evicted. Loads run on a single background thread so the same model is
+    never loaded twice. backends maps a crop to its CropDetector backend.
+
+    A model whose file changes on disk is reloaded on the next get(), and
+    its entries in the shared prediction_cache are dropped.
+    """
+
+    def __init__(self, root=".", memory_budget_mb=None, detector_factory=CropDetector,
+                 backends=None, num_threads=None, prediction_cache=None):
+        self.specs = discover_crops(root)
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.detector_factory = detector_factory
+        self.backends = backends or {}
+        self.num_threads = num_threads
+        self.prediction_cache = prediction_cache
+
+        self._loaded = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="minori-model-load")
+
+        self.loads = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, root="."):
+        """Registry configured from the MINORI_* settings shared by the app, server and streams"""
+        budget = os.getenv("MINORI_MODEL_MEMORY_MB")
+        threads = os.getenv("MINORI_TFLITE_THREADS")
+        return cls(
+            root,
+            memory_budget_mb=float(budget) if budget else None,
+            backends=parse_backends(os.getenv("MINORI_BACKENDS")),
+            num_threads=int(threads) if threads else None,
+            # Exact repeats only, unless near hits are asked for (see PredictionCache)
+            prediction_cache=PredictionCache(
+                max_entries=int(os.getenv("MINORI_PREDICTION_CACHE", 256)),
+                max_distance=int(os.getenv("MINORI_PREDICTION_CACHE_DISTANCE", 0)),
+            ),
+        )
+
+    def crops(self):
+        return list(self.specs)
+
+    def is_loaded(self, crop):
+        with self._lock:
+            return crop in self._loaded
+
+    def prefetch(self, crop):
+        """Start loading crop in the background; returns a Future"""
+        with self._lock:
+            if crop in self._loaded:
+                self._loaded.move_to_end(crop)
+                future = Future()
+                future.set_result(self._loaded[crop])
+                return future
+
+            future = self._pending.get(crop)
+            if future is None:
+                if crop not in self.specs:
+                    raise KeyError(f"Unknown crop: {crop}")
+                future = self._executor.submit(self._load, crop)
+                self._pending[crop] = future
+            return future
+
+    def get(self, crop):
+        """Detector for crop, loading it (and waiting) if necessary"""
+        with self._lock:
+            detector = self._loaded.get(crop)
+            if detector is not None and not detector.is_stale():
+                self._loaded.move_to_end(crop)
+                return detector
+
+        if detector is not None:
+            print(f"[INFO] {crop} model file changed, reloading")
+            self.evict(crop)
+            if self.prediction_cache is not None:
+                self.prediction_cache.invalidate(crop)
+        return self.prefetch(crop).result()
+
+    def evict(self, crop):
+        with self._lock:
+            if self._loaded.pop(crop, None) is not None:
+                self.evictions += 1
+                print(f"[INFO] Unloaded {crop} model")
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(detector.memory_bytes() for detector in self._loaded.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "pending": list(self._pending),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, crop):
+        try:
+            print(f"[INFO] Loading {crop} detection model...")
+            detector = self.detector_factory(
+                self.specs[crop],
+                backend=self.backends.get(crop, "keras"),
+                num_threads=self.num_threads,
+            )
+        except Exception:
+            with self._lock:
+                self._pending.pop(crop, None)
+            raise
+
+        detector.cache = self.prediction_cache
+
+        with self._lock:
+            self._pending.pop(crop, None)
+            self._loaded[crop] = detector
+            self.loads += 1
+            self._enforce_budget(keep=crop)
+        print(f"[INFO] {crop} model loaded")
+        return detector
+
+    def _enforce_budget(self, keep):
+        if self.memory_budget is None:
+            return
+        total = sum(detector.memory_bytes() for detector in self._loaded.values())
+        for crop in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if crop == keep:
+                continue
+            total -= self._loaded.pop(crop).memory_bytes()
+            self.evictions += 1
+            print(f"[INFO] Unloaded {crop} model (memory budget)")
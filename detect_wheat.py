@@ -1,33 +1,10 @@
-import os
-os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
+from crop_models import CropDetector, crop_spec
 
 
-from tensorflow.keras.models import load_model
-import pickle
-import numpy as np
-from tensorflow.keras.preprocessing import image
-
-
-class DetectWheat():
+class DetectWheat(CropDetector):
     def __init__(self):
-        self.model = load_model("Wheat Disease Model and Classes\\wheat_disease_model.h5")
-
-        with open("Wheat Disease Model and Classes\\wheat_class_indices.pkl", "rb") as f:
-            class_indices = pickle.load(f)
-
-        self.class_labels = list(class_indices.keys())
-        
+        super().__init__(crop_spec("Wheat"))
 
     def detect_wheat_disease(self, frame):
-
-
-        img = image.load_img(frame, target_size=(128,128))
-        img_array = image.img_to_array(img) / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
-
-        prediction = self.model.predict(img_array)
-        predicted_class = self.class_labels[np.argmax(prediction)]
-
-        print("Predicted:", predicted_class)
-        return predicted_class
-    
\ No newline at end of file
+        """Classify a BGR frame (ndarray) or an image file path"""
+        return self.detect(frame)
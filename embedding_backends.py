@@ -0,0 +1,199 @@
+import hashlib
+import os
+import pickle
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+LOCAL_MODEL = "local_embeddings.pkl"
+BACKENDS = ("google", "local")
+DEFAULT_VECTORS = {"google": "Vectors", "local": "Vectors-local"}
+# What built Vectors/ before indexes recorded their backend
+LEGACY_BACKEND = "google:models/embedding-001"
+
+
+def backend_from_env():
+    """MINORI_EMBEDDINGS: "google" (remote, the default) or "local" (offline)"""
+    return os.environ.get("MINORI_EMBEDDINGS", "google")
+
+
+def vectors_dir_from_env(backend=None):
+    """MINORI_VECTORS_DIR, or the default index directory of the backend"""
+    return os.environ.get("MINORI_VECTORS_DIR") or DEFAULT_VECTORS[backend or backend_from_env()]
+
+
+def backend_id(embeddings):
+    """Identifier of the vector space an embeddings object produces"""
+    ident = getattr(embeddings, "backend_id", None)
+    if ident:
+        return ident
+    model = getattr(embeddings, "model", "")
+    if type(embeddings).__name__ == "GoogleGenerativeAIEmbeddings":
+        return f"google:{model}"
+    return f"{type(embeddings).__name__}:{model}"
+
+
+class LocalEmbeddings(Embeddings):
+    """CPU-only embeddings: hashed word n-grams -> TF-IDF -> truncated SVD.
+
+    HashingVectorizer needs no vocabulary, so only the IDF weights and the
+    SVD projection are fitted (once, on the corpus being indexed). Texts are
+    embedded a batch at a time with sparse matrix products and L2
+    normalised, so FAISS's L2 distance ranks like cosine similarity. The
+    fitted state is saved next to the index it built; backend_id includes a
+    fingerprint of it, so an index is never queried with a different fit.
+    """
+
+    def __init__(self, dim=256, n_features=2 ** 18, ngram_range=(1, 2), batch_size=256):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+        self.dim = dim
+        self.batch_size = batch_size
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=ngram_range, alternate_sign=False,
+            norm=None, stop_words="english", dtype=np.float32,
+        )
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.svd = TruncatedSVD(n_components=dim, random_state=0)
+        self.projection = None
+        self.fingerprint = None
+        self.loaded_from = None
+
+    @property
+    def needs_fit(self):
+        return self.fingerprint is None
+
+    @property
+    def backend_id(self):
+        return f"local-tfidf-svd:{self.fingerprint}" if self.fingerprint else None
+
+    def fit(self, texts):
+        texts = list(texts)
+        if len(texts) < 2:
+            raise ValueError("need at least 2 texts to fit local embeddings")
+        tfidf = self.tfidf.fit_transform(self.vectorizer.transform(texts))
+        # TruncatedSVD cannot produce more components than there are samples
+        self.svd.n_components = min(self.dim, tfidf.shape[0] - 1)
+        self.svd.fit(tfidf)
+
+        digest = hashlib.sha256()
+        digest.update(self.tfidf.idf_.astype(np.float32).tobytes())
+        digest.update(self.svd.components_.astype(np.float32).tobytes())
+        self.fingerprint = digest.hexdigest()[:12]
+        self._set_projection()
+        return self
+
+    def _set_projection(self):
+        # svd.transform multiplies by components_.T, which scipy handles
+        # slowly; a contiguous (n_features, dim) copy makes it ~100x faster
+        self.projection = np.ascontiguousarray(self.svd.components_.T, dtype=np.float32)
+
+    def transform(self, texts):
+        """(len(texts), dim) float32 array of unit vectors"""
+        if self.needs_fit:
+            raise RuntimeError("LocalEmbeddings used before fit()")
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            vectors = self.tfidf.transform(self.vectorizer.transform(batch)) @ self.projection
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            out.append((vectors / np.maximum(norms, 1e-12)).astype(np.float32))
+        return np.vstack(out) if out else np.zeros((0, self.projection.shape[1]), np.float32)
+
+    def embed_documents(self, texts):
+        return self.transform(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.transform([text])[0].tolist()
+
+    def save(self, directory):
+        path = os.path.join(directory, LOCAL_MODEL)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"tfidf": self.tfidf, "svd": self.svd, "vectorizer": self.vectorizer,
+                         "fingerprint": self.fingerprint}, f)
+        os.replace(path + ".tmp", path)
+
+    def load(self, directory):
+        """Load the fit saved in directory; returns False if there is none"""
+        path = os.path.join(directory, LOCAL_MODEL)
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        self.tfidf, self.svd, self.vectorizer = state["tfidf"], state["svd"], state["vectorizer"]
+        self.fingerprint = state["fingerprint"]
+        self._set_projection()
+        self.loaded_from = os.path.getmtime(path)
+        return True
+
+    def sync(self, directory):
+        """Reload the fit if the one saved in directory has been replaced"""
+        path = os.path.join(directory, LOCAL_MODEL)
+        if os.path.exists(path) and os.path.getmtime(path) != self.loaded_from:
+            self.load(directory)
+
+
+def make_embeddings(backend="google", vectors_dir=None):
+    """Embeddings for backend, with a local fit loaded from vectors_dir if present"""
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    if backend == "local":
+        embeddings = LocalEmbeddings()
+        embeddings.load(vectors_dir or DEFAULT_VECTORS["local"])
+        return embeddings
+    raise ValueError(f"unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+
+
+def benchmark(backends, queries, repeats=5, k=4):
+    """Query latency per backend against its own index, as printed percentiles"""
+    from langchain_community.vectorstores import FAISS
+    from vector_index import IncrementalIndexer
+
+    results = {}
+    for backend in backends:
+        vectors_dir = DEFAULT_VECTORS[backend]
+        embeddings = make_embeddings(backend, vectors_dir)
+        IncrementalIndexer(embeddings, vectors_dir=vectors_dir).update()
+        store = FAISS.load_local(vectors_dir, embeddings, allow_dangerous_deserialization=True)
+
+        embed_times, search_times = [], []
+        for _ in range(repeats):
+            for query in queries:
+                start = time.perf_counter()
+                vector = embeddings.embed_query(query)
+                mid = time.perf_counter()
+                store.similarity_search_by_vector(vector, k=k)
+                embed_times.append(mid - start)
+                search_times.append(time.perf_counter() - mid)
+
+        total = np.add(embed_times, search_times)
+        results[backend] = {
+            "queries": len(total),
+            "embed_p50_ms": float(np.percentile(embed_times, 50) * 1000),
+            "search_p50_ms": float(np.percentile(search_times, 50) * 1000),
+            "total_p50_ms": float(np.percentile(total, 50) * 1000),
+            "total_p95_ms": float(np.percentile(total, 95) * 1000),
+        }
+        print(f"[INFO] {backend}: " + ", ".join(f"{k}={v:.2f}" for k, v in results[backend].items()))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import dotenv
+    from answer_cache import known_diseases
+    from prompts import QUESTION
+
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare retrieval query latency between embedding backends")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["local"])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = [QUESTION.format(crop, disease) for crop, disease in known_diseases()]
+    benchmark(args.backends, queries or [QUESTION.format("wheat", "yellow rust")], args.repeats)
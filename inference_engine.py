@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+from startup import STARTUP, import_tensorflow
+
+
+def percentiles(samples, points=(50, 99)):
+    """Percentiles of a list of latencies (seconds) as {"p50": ..., ...}"""
+    if not len(samples):
+        return {f"p{p}": 0.0 for p in points}
+    values = np.percentile(np.asarray(samples, dtype=np.float64), points)
+    return {f"p{p}": float(v) for p, v in zip(points, values)}
+
+
+class InferenceEngine():
+    """Low-latency calls into a Keras (or cached SavedModel) classifier.
+
+    model.predict() builds a dataset and a batching loop on every call,
+    which dominates the cost for a single 128x128 image. The engine instead
+    calls one tf.function with a fixed (None, H, W, 3) float32 signature, so
+    it is traced exactly once, and runs a warm-up pass when it is created.
+    """
+
+    def __init__(self, model, name="model", warmup=True, max_batch=64):
+        tf = import_tensorflow()
+
+        self.model = model
+        self.name = name
+        self.max_batch = max_batch
+        self.input_shape = tuple(int(d) for d in model.input_shape[1:])
+
+        serve = getattr(model, "serve", None)
+        if serve is not None:
+            # Cached SavedModel: already traced with this signature
+            self._fn = serve
+        else:
+            spec = tf.TensorSpec((None,) + self.input_shape, tf.float32)
+            self._fn = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+
+        if warmup:
+            with STARTUP.phase(f"{name} warm-up inference"):
+                self.predict(np.zeros((1,) + self.input_shape, dtype=np.float32))
+
+    def predict(self, batch):
+        """Class probabilities for an (N, H, W, 3) float32 batch, shape (N, C)"""
+        batch = np.asarray(batch, dtype=np.float32)
+        if len(batch) <= self.max_batch:
+            return np.asarray(self._fn(batch))
+        return np.concatenate([
+            np.asarray(self._fn(batch[i:i + self.max_batch]))
+            for i in range(0, len(batch), self.max_batch)
+        ])
+
+    def predict_one(self, x):
+        """Probabilities for a single (1, H, W, 3) or (H, W, 3) input"""
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim == 3:
+            x = x[None]
+        return self.predict(x)[0]
+
+    def predict_batch(self, batch):
+        """Alias of predict() for N frames, chunked to max_batch"""
+        return self.predict(batch)
+
+
+def benchmark(crop=None, runs=200, batch_sizes=(1, 8, 32)):
+    """Compare model.predict with the engine for the given crop's model"""
+    from crop_models import discover_crops
+    tf = import_tensorflow()
+
+    specs = discover_crops()
+    spec = specs[crop] if crop else next(iter(specs.values()))
+    model = tf.keras.models.load_model(spec.model_path, compile=False)
+    engine = InferenceEngine(model, name=spec.crop)
+
+    rng = np.random.default_rng(0)
+    shape = engine.input_shape
+    results = {}
+
+    for batch_size in batch_sizes:
+        x = rng.random((batch_size,) + shape, dtype=np.float32)
+        model.predict(x, verbose=0)  # first call traces predict_function
+
+        for label, fn in (("model.predict", lambda: model.predict(x, verbose=0)),
+                          ("engine", lambda: engine.predict(x))):
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+            results[(label, batch_size)] = percentiles(samples)
+
+    print(f"{spec.crop} model, {runs} runs per case")
+    print(f"  {'path':<14} {'batch':>5} {'p50 ms':>9} {'p99 ms':>9}")
+    for (label, batch_size), p in results.items():
+        print(f"  {label:<14} {batch_size:>5} {p['p50'] * 1000:9.2f} {p['p99'] * 1000:9.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure p50/p99 inference latency")
+    parser.add_argument("crop", nargs="?", help="crop model to use (default: first found)")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    benchmark(args.crop, args.runs)
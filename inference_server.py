@@ -0,0 +1,315 @@
+import json
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+from inference_engine import percentiles
+from preprocess import FramePreprocessor
+from telemetry import TELEMETRY
+
+
+class QueueFull(Exception):
+    """Raised by MicroBatcher.submit() when the request queue is at capacity"""
+
+
+class MicroBatcher():
+    """Coalesce concurrent single-image requests for one crop into batches.
+
+    One worker thread takes the first queued input, then keeps collecting
+    until it has max_batch inputs or max_wait seconds have passed, and runs
+    them through the crop's shared detector in one predict_batch call. The
+    queue holds at most max_queue inputs; submit() raises QueueFull beyond
+    that instead of letting latency grow without bound.
+    """
+
+    def __init__(self, get_detector, crop, max_batch=32, max_wait=0.005, max_queue=256, window=2048):
+        self.get_detector = get_detector
+        self.crop = crop
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._batch = None
+
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self._stats_lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, name=f"minori-batch-{crop}", daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """Queue one preprocessed (H, W, 3) input; returns a Future of (probs, batch size)"""
+        future = Future()
+        try:
+            self._queue.put_nowait((image, future, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise QueueFull(f"{self.crop} queue is full")
+        return future
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            n = len(items)
+            try:
+                if self._batch is None or self._batch.shape[1:] != items[0][0].shape:
+                    self._batch = np.empty((self.max_batch,) + items[0][0].shape, dtype=np.float32)
+                for i, (image, _, _) in enumerate(items):
+                    self._batch[i] = image
+                with TELEMETRY.span("inference", crop=self.crop, batch=n):
+                    probs = self.get_detector(self.crop).engine.predict_batch(self._batch[:n])
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += n
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            with self._stats_lock:
+                self.batch_sizes[n] += 1
+                self.requests += n
+                self.latencies.extend(now - queued for _, _, queued in items)
+            for (_, future, _), row in zip(items, probs):
+                future.set_result((row, n))
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = list(self.latencies)
+            return {
+                "queue_depth": self.depth(),
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "errors": self.errors,
+                "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "latency_ms": {k: v * 1000 for k, v in percentiles(latencies, (50, 95, 99)).items()},
+            }
+
+
+class InferenceService():
+    """Decode, preprocess and classify images via per-crop MicroBatchers"""
+
+    def __init__(self, registry, max_batch=32, max_wait=0.005, max_queue=256):
+        self.registry = registry
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started = time.time()
+
+    def batcher(self, crop):
+        with self._lock:
+            batcher = self._batchers.get(crop)
+            if batcher is None:
+                if crop not in self.registry.crops():
+                    raise KeyError(crop)
+                batcher = MicroBatcher(self.registry.get, crop, self.max_batch, self.max_wait, self.max_queue)
+                self._batchers[crop] = batcher
+            return batcher
+
+    def classify(self, crop, data, timeout=30.0):
+        """{"label", "confidence", "probs", "batch_size"} for an encoded image"""
+        batcher = self.batcher(crop)
+        detector = self.registry.get(crop)
+
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("could not decode image")
+        preprocessor = getattr(self._local, "preprocessor", None)
+        if preprocessor is None or preprocessor.target_size != detector.preprocessor.target_size:
+            preprocessor = self._local.preprocessor = FramePreprocessor(detector.preprocessor.target_size)
+        h, w = preprocessor.target_size
+        image = preprocessor.preprocess_into(frame, np.empty((h, w, 3), dtype=np.float32))
+
+        probs, batch_size = batcher.submit(image).result(timeout)
+        best = int(np.argmax(probs))
+        return {
+            "crop": crop,
+            "label": detector.class_labels[best],
+            "confidence": float(probs[best]),
+            "probs": dict(zip(detector.class_labels, map(float, probs))),
+            "batch_size": batch_size,
+        }
+
+    def metrics(self):
+        with self._lock:
+            batchers = dict(self._batchers)
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue": self.max_queue,
+            "models": self.registry.stats(),
+            "crops": {crop: batcher.stats() for crop, batcher in batchers.items()},
+        }
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    """POST /predict/<crop> (body: encoded image), GET /metrics, GET /health"""
+
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.service.metrics())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok", "crops": self.service.registry.crops()})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length)
+        if not self.path.startswith("/predict/"):
+            self._send(404, {"error": "not found"})
+            return
+
+        crop = self.path[len("/predict/"):].strip("/")
+        start = time.perf_counter()
+        try:
+            result = self.service.classify(crop, data)
+        except KeyError:
+            self._send(404, {"error": f"unknown crop '{crop}'", "crops": self.service.registry.crops()})
+        except QueueFull as e:
+            self._send(503, {"error": str(e)}, {"Retry-After": "1"})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+        else:
+            result["latency_ms"] = (time.perf_counter() - start) * 1000
+            self._send(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections under a burst of clients
+    request_queue_size = 256
+
+
+def make_server(service, host="127.0.0.1", port=8765):
+    handler = type("Handler", (InferenceHandler,), {"service": service})
+    return InferenceHTTPServer((host, port), handler)
+
+
+def load_test(url, crop, image_path, clients=16, requests=200):
+    """Hit a running server from `clients` threads and print throughput"""
+    import urllib.error
+    import urllib.request
+
+    with open(image_path, "rb") as f:
+        data = f.read()
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+
+    def client(n):
+        for _ in range(n):
+            request = urllib.request.Request(f"{url}/predict/{crop}", data=data, method="POST")
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError as e:
+                status = type(e).__name__
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(requests // clients,)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    summary = {k: v * 1000 for k, v in percentiles(latencies, (50, 95, 99)).items()}
+    print(f"[INFO] {len(latencies)} requests in {seconds:.2f} s ({len(latencies) / seconds:.1f} req/s), "
+          f"status {dict(statuses)}, latency ms " + ", ".join(f"{k}={v:.1f}" for k, v in summary.items()))
+    with urllib.request.urlopen(f"{url}/metrics") as response:
+        print(json.dumps(json.loads(response.read())["crops"].get(crop, {}), indent=2))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve crop disease detection over HTTP with micro-batching")
+    sub = parser.add_subparsers(dest="command")
+    serve = sub.add_parser("serve", help="run the server (default)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--max-batch", type=int, default=32)
+    serve.add_argument("--max-wait-ms", type=float, default=5.0)
+    serve.add_argument("--max-queue", type=int, default=256)
+    serve.add_argument("--preload", nargs="*", default=[], help="crops to load before accepting requests")
+    bench = sub.add_parser("bench", help="load-test a running server")
+    bench.add_argument("crop")
+    bench.add_argument("image")
+    bench.add_argument("--url", default="http://127.0.0.1:8765")
+    bench.add_argument("--clients", type=int, default=16)
+    bench.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        load_test(args.url, args.crop, args.image, args.clients, args.requests)
+    else:
+        if args.command is None:
+            args = serve.parse_args([])
+        from crop_models import CropModelRegistry
+
+        registry = CropModelRegistry.from_env()
+        for crop in args.preload:
+            registry.get(crop)
+
+        service = InferenceService(registry, args.max_batch, args.max_wait_ms / 1000, args.max_queue)
+        server = make_server(service, args.host, args.port)
+        print(f"[INFO] Serving {', '.join(registry.crops())} on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            registry.shutdown()
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from collections import deque
+
+
+class LatestFrameQueue():
+    """Bounded queue where a new item pushes out the oldest pending one.
+
+    Used between the camera loop and the model so that a slow prediction
+    never builds up a backlog of stale frames.
+    """
+
+    def __init__(self, maxsize=1):
+        self._items = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        """Queue an item, returning True if an older item had to be dropped"""
+        with self._cond:
+            dropped = False
+            if len(self._items) >= self._maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                dropped = True
+            self._items.append(item)
+            self._cond.notify()
+            return dropped
+
+    def get(self, timeout=None):
+        """Wait for the next item; returns None on timeout or after close()"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+
+class InferenceWorker():
+    """Run detections on a background thread.
+
+    Frames go in through submit() (latest frame wins), finished results are
+    collected in a queue that the Tk thread drains with drain_results(), so
+    nothing on the worker thread ever touches a widget.
+    """
+
+    def __init__(self, detect_fn, maxsize=1):
+        self.detect_fn = detect_fn
+        self.frames = LatestFrameQueue(maxsize)
+        self.results = queue.Queue()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy = False
+        self.last_latency = 0.0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="minori-inference", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self.frames.close()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, frame, crop_type):
+        """Queue a frame for detection; the caller must not modify it afterwards"""
+        self.submitted += 1
+        return self.frames.put((frame, crop_type, time.time()))
+
+    def drain_results(self):
+        """Return every finished (crop_type, result, error, latency) tuple"""
+        items = []
+        while True:
+            try:
+                items.append(self.results.get_nowait())
+            except queue.Empty:
+                return items
+
+    def stats(self):
+        """Queue depth and counters for each stage of the pipeline"""
+        return {
+            "pending": self.frames.qsize(),
+            "in_flight": 1 if self.busy else 0,
+            "results": self.results.qsize(),
+            "submitted": self.submitted,
+            "dropped": self.frames.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "last_latency": self.last_latency,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            item = self.frames.get(timeout=0.5)
+            if item is None:
+                continue
+
+            frame, crop_type, _ = item
+            self.busy = True
+            start = time.perf_counter()
+            try:
+                result = self.detect_fn(frame, crop_type)
+                error = None
+                self.completed += 1
+            except Exception as e:
+                result = None
+                error = e
+                self.failed += 1
+            finally:
+                self.busy = False
+
+            self.last_latency = time.perf_counter() - start
+            self.results.put((crop_type, result, error, self.last_latency))
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+LLMS = ("groq", "fake")
+
+
+class FakeAdvisorLLM(BaseChatModel):
+    """Deterministic offline stand-in for the Groq chat model.
+
+    The reply is the first max_words words of the context in the last
+    message (or of the message itself), prefixed with the question's crop
+    and disease, so the same prompt always gives the same answer. It
+    streams one word per chunk after first_token_delay seconds and then
+    token_delay seconds per word, so latency can be simulated for
+    benchmarks without a network.
+    """
+
+    max_words: int = 60
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-advisor"
+
+    def reply(self, messages):
+        text = messages[-1].content if messages else ""
+        question = re.search(r"Crop: (.*?), Disease: (.*)", text)
+        context = text.split("Context:", 1)[-1].split("Question:", 1)[0]
+        words = context.split()[:self.max_words]
+        head = f"Advice for {question.group(2).strip()} on {question.group(1).strip()}:" if question else "Advice:"
+        return " ".join([head] + words) if words else "I don't know"
+
+    def _words(self, messages):
+        words = self.reply(messages).split(" ")
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay + self.token_delay * len(self._words(messages)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_delay)
+        for word in self._words(messages):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+            time.sleep(self.token_delay)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_delay)
+        for word in self._words(messages):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(self.token_delay)
+
+
+def make_llm(name="groq"):
+    """Chat model by name: "groq" (remote) or "fake" (FakeAdvisorLLM, delays from env)"""
+    if name == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(groq_api_key=os.getenv("GROQ_API"), model="openai/gpt-oss-120b", temperature=0)
+    if name == "fake":
+        return FakeAdvisorLLM(
+            first_token_delay=float(os.environ.get("MINORI_FAKE_LLM_FIRST_TOKEN", "0")),
+            token_delay=float(os.environ.get("MINORI_FAKE_LLM_TOKEN_DELAY", "0")),
+        )
+    raise ValueError(f"unknown LLM {name!r}, expected one of {LLMS}")
@@ -1,42 +1,89 @@
 import os
 os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
 
+from startup import STARTUP
 import tkinter as tk
 from tkinter import ttk, messagebox
 import cv2
-from PIL import Image, ImageTk
 import numpy as np
-import tempfile
 import time
-from pathlib import Path
-from detect_rice import DetectRice
-from detect_wheat import DetectWheat
+import sqlite3
+from crop_models import CropModelRegistry
+from inference_worker import InferenceWorker
+from camera import CameraGrabber, DeviceSource
+from renderer import FramePacer, FrameRenderer, draw_detection_overlay
+from scene_gate import SceneChangeGate
+from answer_cache import AnswerCache
+from embedding_backends import vectors_dir_from_env
+from telemetry import TELEMETRY, format_summary
+from session_recorder import SessionRecorder
+from tta import TestTimeAugmentation, parse_views
 
 
 class MinoriApp:
-    def __init__(self, root):
+    def __init__(self, root, source=None):
         self.root = root
         self.root.title("Minori AI - Disease Detection")
         self.root.geometry("800x600")
         self.root.configure(bg='#2c3e50')
         
+        # Crop models are discovered now but only loaded when first needed
+        self.models = CropModelRegistry.from_env()
+        
         # Application state
         self.models_loaded = False
         self.detection_active = False
-        self.current_crop = tk.StringVar(value="Rice")
+        crops = self.models.crops()
+        self.current_crop = tk.StringVar(value=crops[0] if crops else "")
         
         # Results
+        # Keyed on the same index GenerateSolution answers from (and prewarms)
+        # Read on the inference worker, with a short lock wait since a
+        # --prewarm run may be writing to it
+        self.answer_cache = AnswerCache(vectors_dir=vectors_dir_from_env(), timeout=1.0)
         self.latest_result = "No Detection"
         self.is_healthy = True
         self.last_detection_time = 0
-        self.detection_cooldown = 3.0
         
-        # Camera
-        self.cap = None
-        self.temp_dir = Path(tempfile.mkdtemp(prefix="minori_"))
+        # Every detection is appended to session_data/ (MINORI_SESSION_RECORD=0 turns it off)
+        self.recorder = None
+        if os.getenv("MINORI_SESSION_RECORD", "1") != "0":
+            self.recorder = SessionRecorder(
+                history=int(os.getenv("MINORI_SESSION_HISTORY", 100)),
+                max_bytes=int(float(os.getenv("MINORI_SESSION_MAX_MB", 50)) * 1024 * 1024),
+                thumbnails=os.getenv("MINORI_SESSION_THUMBNAILS", "1") != "0",
+            )
+        
+        # Optional test-time augmentation, e.g. MINORI_TTA=roi,tiles,hflip
+        self.tta = None
+        if os.getenv("MINORI_TTA"):
+            self.tta = TestTimeAugmentation(
+                views=parse_views(os.getenv("MINORI_TTA")),
+                grid=int(os.getenv("MINORI_TTA_GRID", 2)),
+                mode=os.getenv("MINORI_TTA_AGGREGATE", "mean"),
+                # Each GUI detection is a new scene (gate trigger or Detect Now),
+                # so averaging with earlier results would blend different leaves
+                smoothing=int(os.getenv("MINORI_TTA_SMOOTHING", 1)),
+            )
+        
+        # Continuous mode only runs the model when the ROI changes and settles
+        self.scene_gate = SceneChangeGate(
+            change_threshold=float(os.getenv("MINORI_GATE_CHANGE", 12.0)),
+            stable_threshold=float(os.getenv("MINORI_GATE_STABLE", 4.0)),
+            stable_frames=int(os.getenv("MINORI_GATE_FRAMES", 3)),
+        )
+        
+        # Camera (any FrameSource; a local device unless one is given)
+        self.source = source or DeviceSource()
+        self.camera = None
+        self.last_frame_seq = 0
+        
+        # Background inference
+        self.inference_worker = None
         
         # Setup UI
         self.setup_ui()
+        STARTUP.mark("window created")
         
         # Initialize everything after UI is ready
         self.root.after(100, self.initialize_everything)
@@ -71,12 +118,13 @@ class MinoriApp:
         self.crop_combo = ttk.Combobox(
             control_frame,
             textvariable=self.current_crop,
-            values=['Rice', 'Wheat'],
+            values=self.models.crops(),
             state='readonly',
             font=('Arial', 11),
             width=10
         )
         self.crop_combo.pack(side='left', pady=15)
+        self.crop_combo.bind('<<ComboboxSelected>>', self.on_crop_selected)
         
         # Detection button
         self.detection_btn = tk.Button(
@@ -132,6 +180,8 @@ class MinoriApp:
             font=('Arial', 12)
         )
         self.camera_label.pack(fill='both', expand=True, padx=5, pady=5)
+        self.renderer = FrameRenderer(self.camera_label)
+        self.pacer = FramePacer()
         
         # Results panel
         results_frame = tk.Frame(content_frame, bg='#34495e', width=250, relief='solid', bd=2)
@@ -159,6 +209,17 @@ class MinoriApp:
         )
         self.result_text.pack(fill='x', padx=10, pady=10)
         
+        # Pipeline stats
+        self.stats_label = tk.Label(
+            results_frame,
+            text="",
+            font=('Consolas', 8),
+            bg='#34495e',
+            fg='#bdc3c7',
+            justify='left'
+        )
+        self.stats_label.pack(padx=10, anchor='w')
+        
         # Instructions
         instructions = """Instructions:
 1. Select crop type
@@ -186,20 +247,19 @@ class MinoriApp:
             self.root.update()
             
             # Initialize camera
-            self.init_camera()
-            
-            # Load models
-            self.status_label.config(text="Loading AI models...", fg='#f39c12')
-            self.root.update()
-            
-            print("[INFO] Loading Rice detection model...")
-            self.rice_detector = DetectRice()
-            
-            print("[INFO] Loading Wheat detection model...")
-            self.wheat_detector = DetectWheat()
+            with STARTUP.phase("camera start"):
+                self.init_camera()
             
+            # TensorFlow is imported and the selected crop's model loaded in
+            # the background; the others are loaded when they are picked
+            future = self.models.prefetch(self.current_crop.get())
+            future.add_done_callback(lambda f: print(STARTUP.report()))
             self.models_loaded = True
-            print("[INFO] All models loaded successfully!")
+            
+            # Predictions run off the Tk thread
+            self.inference_worker = InferenceWorker(self.run_detection)
+            self.inference_worker.start()
+            self.poll_inference_results()
             
             # Enable buttons and start camera feed
             self.status_label.config(text="Ready for detection ✓", fg='#27ae60')
@@ -216,52 +276,50 @@ class MinoriApp:
             messagebox.showerror("Initialization Error", error_msg)
     
     def init_camera(self):
-        """Initialize camera"""
-        try:
-            self.cap = cv2.VideoCapture(1)
-            if not self.cap.isOpened():
-                self.cap = cv2.VideoCapture(0)
-                        
-            if not self.cap.isOpened():
-                raise Exception("Could not access camera")
-                
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            
+        """Start the background camera grabber"""
+        self.camera = CameraGrabber(self.source)
+        self.camera.start()
+        self.root.after(50, self.check_camera_started, time.monotonic() + 2.0)
+    
+    def check_camera_started(self, deadline):
+        """Report the first frame without blocking the Tk thread for it"""
+        # If the device is not there yet the grabber keeps retrying and the
+        # preview says so.
+        if self.camera_available():
             print("[INFO] Camera initialized successfully")
-            
-        except Exception as e:
-            raise Exception(f"Camera initialization failed: {e}")
+        elif time.monotonic() < deadline:
+            self.root.after(50, self.check_camera_started, deadline)
+        else:
+            print("[WARN] No camera frames yet, will keep retrying")
+    
+    def camera_available(self):
+        return self.camera is not None and self.camera.latest() is not None
     
     def update_camera(self):
         """Update camera feed"""
-        if self.cap and self.cap.isOpened():
-            ret, frame = self.cap.read()
-            
-            if ret:
-                frame = cv2.flip(frame, 1)  # Mirror effect
+        self.pacer.begin()
+        packet = self.camera.latest() if self.camera else None
+        
+        if packet is not None and self.camera.connected:
+            if packet.seq != self.last_frame_seq:
+                self.last_frame_seq = packet.seq
+                frame = cv2.flip(packet.frame, 1)  # Mirror effect (also copies out of the ring)
                 
-                # Auto-detect if continuous detection is active
-                if (self.detection_active and 
-                    time.time() - self.last_detection_time > self.detection_cooldown):
+                # Auto-detect when the scene has changed and settled
+                if self.detection_active and self.scene_gate.update(frame):
                     self.perform_detection_on_frame(frame)
                 
-                # Draw detection box if we have a result
-                if self.latest_result != "No Detection":
-                    frame = self.draw_detection_box(frame)
-                
-                # Display frame
+                # Display frame, with the detection box if we have a result
                 self.display_frame(frame)
-            else:
-                # Camera feed lost
-                self.camera_label.config(
-                    text="📷 Camera Feed\n\nCamera disconnected",
-                    image=""
-                )
-        
-        # Schedule next update
-        self.root.after(30, self.update_camera)
+        else:
+            # Not started yet, or feed lost; the grabber reconnects on its own
+            self.renderer.reset()
+            state = "Starting camera..." if self.last_frame_seq == 0 else "Camera disconnected\nReconnecting..."
+            self.camera_label.config(text=f"📷 Camera Feed\n\n{state}", image="")
+        
+        # Schedule next update, paced to the camera and our own render time
+        fps = self.camera.fps if self.camera else None
+        self.root.after(self.pacer.next_delay(fps), self.update_camera)
     
     def detect_now(self):
         """Perform single detection"""
@@ -269,17 +327,13 @@ class MinoriApp:
             messagebox.showwarning("Not Ready", "Models are still loading.")
             return
             
-        if not (self.cap and self.cap.isOpened()):
+        if not self.camera_available():
             messagebox.showerror("Camera Error", "Camera is not available.")
             return
         
-        # Capture current frame
-        ret, frame = self.cap.read()
-        if ret:
-            frame = cv2.flip(frame, 1)
-            self.perform_detection_on_frame(frame)
-        else:
-            messagebox.showerror("Capture Error", "Failed to capture frame.")
+        # Take the newest frame from the grabber
+        packet = self.camera.latest()
+        self.perform_detection_on_frame(cv2.flip(packet.frame, 1))
     
     def toggle_detection(self):
         """Toggle continuous detection on/off"""
@@ -287,7 +341,7 @@ class MinoriApp:
             messagebox.showwarning("Not Ready", "Models are still loading.")
             return
         
-        if not (self.cap and self.cap.isOpened()):
+        if not self.camera_available():
             messagebox.showerror("Camera Error", "Camera is not available.")
             return
         
@@ -298,7 +352,11 @@ class MinoriApp:
             self.status_label.config(text=f"Auto-detecting {self.current_crop.get()}...", fg='#e74c3c')
             self.crop_combo.config(state='disabled')
             self.detect_now_btn.config(state='disabled')
+            self.scene_gate.reset()
+            if self.tta:
+                self.tta.reset()
         else:
+            self.scene_gate.stop()
             self.detection_btn.config(text="Start Detection", bg='#27ae60')
             self.status_label.config(text="Ready for detection ✓", fg='#27ae60')
             self.crop_combo.config(state='readonly')
@@ -306,45 +364,102 @@ class MinoriApp:
             self.latest_result = "No Detection"
     
     def perform_detection_on_frame(self, frame):
-        """Perform detection on given frame"""
+        """Queue a frame for detection on the inference worker"""
+        # The crop is read here because Tk variables belong to the UI thread
+        crop_type = self.current_crop.get()
+        self.inference_worker.submit(frame, crop_type)
+        self.last_detection_time = time.time()
+        
+        self.status_label.config(text=f"Analyzing {crop_type}...", fg='#f39c12')
+        self.update_stats_display()
+    
+    def run_detection(self, frame, crop_type):
+        """Run the detector for crop_type (called on the inference worker)"""
+        start = time.perf_counter()
+        detector = self.models.get(crop_type)
+        if self.tta:
+            label, _, probs = self.tta.classify(detector, frame)
+        else:
+            label, probs = detector.classify(frame)
+        print("Predicted:", label)
+        if self.recorder:
+            # Log what this frame alone says, not a smoothed blend with earlier ones
+            frame_label = max(probs, key=probs.get)
+            self.recorder.record(crop_type, frame_label, probs, time.perf_counter() - start, frame)
+        return label, self.lookup_advice(crop_type, label)
+
+    def lookup_advice(self, crop_type, label):
+        """Cached treatment advice for a disease label, or None (off the Tk thread)"""
+        if "healthy" in label.lower():
+            return None
         try:
-            # Save frame temporarily
-            timestamp = int(time.time() * 1000)
-            temp_path = self.temp_dir / f"frame_{timestamp}.jpg"
-            cv2.imwrite(str(temp_path), frame)
-            
-            # Update status
-            self.status_label.config(text=f"Analyzing {self.current_crop.get()}...", fg='#f39c12')
-            self.root.update()
+            return self.answer_cache.get(crop_type, label)
+        except sqlite3.Error as e:
+            print(f"[WARN] Answer cache unavailable: {e}")
+            return None
+    
+    def on_crop_selected(self, event=None):
+        """Start loading the newly selected crop's model right away"""
+        try:
+            self.models.prefetch(self.current_crop.get())
+        except KeyError as e:
+            print(f"[ERROR] {e}")
+    
+    def poll_inference_results(self):
+        """Hand finished detections back to the Tk thread"""
+        for crop_type, result, error, latency in self.inference_worker.drain_results():
+            if error is not None:
+                print(f"[ERROR] Detection failed: {error}")
+                self.status_label.config(text="Detection failed ✗", fg='#e74c3c')
+                continue
             
-            try:
-                # Run detection based on crop type
-                crop_type = self.current_crop.get()
-                if crop_type == "Rice":
-                    result = self.rice_detector.detect_rice_disease(str(temp_path))
-                else:  # Wheat
-                    result = self.wheat_detector.detect_wheat_disease(str(temp_path))
-                
-                # Process result
-                self.process_detection_result(result, crop_type)
-                self.last_detection_time = time.time()
-                
-            finally:
-                # Clean up temp file
-                if temp_path.exists():
-                    temp_path.unlink()
-                    
-        except Exception as e:
-            print(f"[ERROR] Detection failed: {e}")
-            self.status_label.config(text="Detection failed ✗", fg='#e74c3c')
+            label, advice = result
+            self.process_detection_result(label, crop_type, advice)
+            self.last_detection_time = time.time()
+        
+        self.update_stats_display()
+        self.root.after(50, self.poll_inference_results)
     
-    def process_detection_result(self, result, crop_type):
+    def update_stats_display(self):
+        """Show queue depth and drop counts for the inference pipeline"""
+        stats = self.inference_worker.stats()
+        cache = self.models.prediction_cache.stats()
+        self.stats_label.config(text=(
+            f"Queue: {stats['pending']} pending, {stats['in_flight']} running, "
+            f"{stats['results']} done\n"
+            f"Frames: {stats['submitted']} sent, {stats['dropped']} dropped\n"
+            f"Last inference: {stats['last_latency'] * 1000:.0f} ms\n"
+            f"Camera: {self.camera.fps:.1f} fps, {self.camera.reconnects} reconnects\n"
+            f"Models: {', '.join(self.models.stats()['loaded']) or 'none'} loaded\n"
+            f"Gate: {self.scene_gate.triggers} runs, {self.scene_gate.saved()} saved\n"
+            f"Cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evicted"
+            + self.tta_text()
+            + self.stage_latency_text()
+        ))
+
+    def tta_text(self):
+        """View agreement and label flip rates, when MINORI_TTA is set"""
+        if not self.tta:
+            return ""
+        stats = self.tta.stats()
+        flips = stats["flip_rate"]
+        return (f"\nTTA: {len(stats['views'])} views, {stats['agreement']:.0%} agree, "
+                f"flips {flips['single']:.0%} -> {flips['smoothed']:.0%}")
+
+    def stage_latency_text(self):
+        """p95 per pipeline stage, when MINORI_TELEMETRY is on"""
+        if not TELEMETRY.enabled:
+            return ""
+        summary = TELEMETRY.summary(("capture", "preprocess", "inference", "render"))
+        return "\np95: " + ", ".join(f"{stage} {s['p95_ms']:.1f}" for stage, s in summary.items()) + " ms"
+    
+    def process_detection_result(self, result, crop_type, advice=None):
         """Process and display detection result"""
         self.latest_result = result
         self.is_healthy = "healthy" in result.lower()
         
         # Update results display
-        self.update_results_display(result, crop_type)
+        self.update_results_display(result, crop_type, advice)
         
         # Update status
         status_text = "✅ Healthy detected" if self.is_healthy else "🚨 Disease detected"
@@ -358,7 +473,7 @@ class MinoriApp:
         
         print(f"[DETECTION] {crop_type}: {result} ({'Healthy' if self.is_healthy else 'Disease'})")
     
-    def update_results_display(self, result, crop_type):
+    def update_results_display(self, result, crop_type, advice=None):
         """Update the results text display"""
         self.result_text.config(state='normal')
         self.result_text.delete(1.0, tk.END)
@@ -373,73 +488,34 @@ class MinoriApp:
         result_info += f"Detection: {disease_name}\n"
         
         if not self.is_healthy:
-            result_info += "\n⚠️ Recommendation:\nConsult agricultural expert\nfor treatment options."
+            # Advice pre-generated with `python GenerateSolution.py --prewarm`,
+            # looked up by run_detection
+            if advice:
+                result_info += f"\n⚠️ Recommendation:\n{advice}"
+            else:
+                result_info += "\n⚠️ Recommendation:\nConsult agricultural expert\nfor treatment options."
         else:
             result_info += "\n✅ Plant appears healthy.\nContinue regular monitoring."
         
+        if self.recorder:
+            history = self.recorder.recent(5)
+            if history:
+                result_info += "\n\nRecent:\n" + "\n".join(
+                    f"{time.strftime('%H:%M:%S', time.localtime(r['ts']))} {r['crop']}: "
+                    f"{r['label'].replace('_', ' ')}" for r in reversed(history))
+        
         self.result_text.insert(1.0, result_info)
         self.result_text.config(state='disabled')
     
     def draw_detection_box(self, frame):
         """Draw detection box on frame"""
-        h, w = frame.shape[:2]
-        
-        # Create centered detection box
-        box_size = min(h, w) // 2
-        x1 = (w - box_size) // 2
-        y1 = (h - box_size) // 2
-        x2 = x1 + box_size
-        y2 = y1 + box_size
-        
-        # Color based on health status
-        color = (0, 255, 0) if self.is_healthy else (0, 0, 255)  # Green/Red
-        
-        # Draw main box with thicker border
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 4)
-        
-        # Add corner markers for a more professional look
-        corner_length = 30
-        cv2.line(frame, (x1, y1), (x1 + corner_length, y1), color, 6)
-        cv2.line(frame, (x1, y1), (x1, y1 + corner_length), color, 6)
-        cv2.line(frame, (x2, y1), (x2 - corner_length, y1), color, 6)
-        cv2.line(frame, (x2, y1), (x2, y1 + corner_length), color, 6)
-        cv2.line(frame, (x1, y2), (x1 + corner_length, y2), color, 6)
-        cv2.line(frame, (x1, y2), (x1, y2 - corner_length), color, 6)
-        cv2.line(frame, (x2, y2), (x2 - corner_length, y2), color, 6)
-        cv2.line(frame, (x2, y2), (x2, y2 - corner_length), color, 6)
-        
-        # Add label
-        label = "HEALTHY" if self.is_healthy else "DISEASE DETECTED"
-        font_scale = 0.8
-        thickness = 2
-        
-        (text_w, text_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
-        
-        # Label background
-        cv2.rectangle(frame, (x1, y1 - text_h - 15), (x1 + text_w + 10, y1 - 5), color, -1)
-        
-        # Label text
-        cv2.putText(frame, label, (x1 + 5, y1 - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
-        
-        return frame
+        return draw_detection_overlay(frame, self.is_healthy)
     
     def display_frame(self, frame):
         """Convert and display frame in tkinter"""
         try:
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            
-            # Resize to fit label
-            label_w = self.camera_label.winfo_width()
-            label_h = self.camera_label.winfo_height()
-            
-            if label_w > 1 and label_h > 1:
-                img = img.resize((label_w - 10, label_h - 10), Image.Resampling.LANCZOS)
-            
-            photo = ImageTk.PhotoImage(img)
-            self.camera_label.configure(image=photo, text="")
-            self.camera_label.image = photo
+            overlay = self.is_healthy if self.latest_result != "No Detection" else None
+            self.renderer.render(frame, overlay)
             
         except Exception as e:
             print(f"[ERROR] Display frame: {e}")
@@ -448,16 +524,21 @@ class MinoriApp:
         """Clean up resources"""
         self.detection_active = False
         
-        if self.cap:
-            self.cap.release()
+        if self.inference_worker:
+            self.inference_worker.stop()
         
-        # Clean temp directory
-        try:
-            for temp_file in self.temp_dir.glob("*"):
-                temp_file.unlink()
-            self.temp_dir.rmdir()
-        except Exception as e:
-            print(f"[ERROR] Cleanup: {e}")
+        self.models.shutdown()
+        
+        if self.camera:
+            self.camera.stop()
+        
+        if self.recorder:
+            self.recorder.close()
+            print(f"[INFO] Session: {self.recorder.stats()}")
+        
+        if TELEMETRY.enabled:
+            print(format_summary(TELEMETRY.summary()))
+            TELEMETRY.close()
         
         cv2.destroyAllWindows()
 
@@ -465,6 +546,12 @@ class MinoriApp:
 def main():
     """Main application entry point"""
     print("[INFO] Starting Minori AI...")
+    if os.getenv("MINORI_STREAMS"):
+        # Several cameras, e.g. MINORI_STREAMS=0@Rice,1@Wheat,tray.mp4@Rice
+        import multi_stream
+        multi_stream.main()
+        return
+    
     root = tk.Tk()
     app = MinoriApp(root)
     
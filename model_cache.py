@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+from startup import STARTUP, import_tensorflow
+
+
+CACHE_DIR = ".model_cache"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_version(path):
+    """Cheap change marker for a model file (modification time and size)"""
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def cache_path(model_path, digest, cache_dir=CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f"{stem}-{digest[:16]}")
+
+
+class CachedModel():
+    """A converted model loaded from the cache.
+
+    The cache holds a TensorFlow SavedModel with an already traced serving
+    function, so loading skips rebuilding the Keras layers from HDF5 and the
+    first call skips tracing. predict() and count_params() mirror the Keras
+    methods the detectors use.
+    """
+
+    def __init__(self, path):
+        tf = import_tensorflow()
+        self.path = path
+        self.loaded = tf.saved_model.load(path)
+        self.serve = self.loaded.serve
+
+        with open(os.path.join(path, "minori_meta.json")) as f:
+            self.meta = json.load(f)
+        self.input_shape = tuple(self.meta["input_shape"])
+
+    def __call__(self, x, training=False):
+        return self.serve(x)
+
+    def predict(self, x, verbose=0):
+        return np.asarray(self.serve(np.asarray(x, dtype=np.float32)))
+
+    def count_params(self):
+        return self.meta["params"]
+
+
+def convert_model(model, model_path, digest, target):
+    """Export a Keras model as a SavedModel at target, atomically"""
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    if hasattr(model, "export"):
+        model.export(tmp, verbose=False)  # Keras 3: defines `serve`
+    else:
+        import tensorflow as tf
+
+        spec = tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)
+        serve = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+        module = tf.Module()
+        module.model = model
+        module.serve = serve
+        tf.saved_model.save(module, tmp)
+
+    meta = {
+        "source": os.path.abspath(model_path),
+        "sha256": digest,
+        "params": int(model.count_params()),
+        "input_shape": [None] + [int(d) for d in model.input_shape[1:]],
+    }
+    with open(os.path.join(tmp, "minori_meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+    # Drop conversions of older versions of the same model file
+    stem = os.path.basename(target).rsplit("-", 1)[0]
+    for entry in os.listdir(os.path.dirname(target) or "."):
+        path = os.path.join(os.path.dirname(target), entry)
+        if entry.startswith(stem + "-") and path != target and not entry.endswith(".tmp"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_model_cached(model_path, cache_dir=CACHE_DIR, use_cache=True):
+    """Load a Keras .h5 model, converting it once to a fast-loading cache.
+
+    The cache entry is keyed by the SHA-256 of the .h5 file, so replacing the
+    model file automatically produces (and uses) a fresh conversion. Any
+    problem with the cache falls back to loading the .h5 directly.
+    """
+    tf = import_tensorflow()
+    name = os.path.basename(model_path)
+
+    if use_cache:
+        digest = file_hash(model_path)
+        target = cache_path(model_path, digest, cache_dir)
+
+        if os.path.exists(os.path.join(target, "minori_meta.json")):
+            try:
+                with STARTUP.phase(f"deserialize {name}", cache="hit"):
+                    return CachedModel(target)
+            except Exception as e:
+                print(f"[WARN] Ignoring broken model cache {target}: {e}")
+
+    with STARTUP.phase(f"deserialize {name}", cache="miss" if use_cache else "off"):
+        model = tf.keras.models.load_model(model_path, compile=False)
+
+    if use_cache:
+        try:
+            with STARTUP.phase(f"convert {name}"):
+                os.makedirs(cache_dir, exist_ok=True)
+                convert_model(model, model_path, digest, target)
+            print(f"[INFO] Cached converted model at {target}")
+        except Exception as e:
+            print(f"[WARN] Could not cache converted model: {e}")
+
+    return model
@@ -0,0 +1,441 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque, namedtuple
+
+import cv2
+import numpy as np
+from camera import CameraGrabber, DeviceSource, SyntheticSource, VideoFileSource
+from inference_engine import percentiles
+from preprocess import FramePreprocessor
+from renderer import detection_box
+from scene_gate import SceneChangeGate
+from telemetry import TELEMETRY
+
+
+StreamSpec = namedtuple("StreamSpec", ["name", "source", "crop"])
+StreamResult = namedtuple("StreamResult", ["label", "probs", "latency", "batch_size", "timestamp"])
+
+
+def parse_streams(text, default_crop=None):
+    """"0@Rice, trays.mp4@Wheat, rtsp://cam/2@Maize" -> [StreamSpec, ...].
+
+    Each item is a source followed by @crop (the last @, so URLs with
+    user@host still work). Without @crop, default_crop is used. Names are
+    stream0, stream1, ... unless written as name=source@crop, and must be
+    unique since results and recordings are labelled by name.
+    """
+    specs = []
+    for i, item in enumerate(s.strip() for s in (text or "").split(",")):
+        if not item:
+            continue
+        name = f"stream{i}"
+        head, _, tail = item.partition("=")
+        if tail and "://" not in head and "/" not in head:
+            name, item = head.strip(), tail.strip()
+        source, sep, crop = item.rpartition("@")
+        if not sep or any(c in crop for c in "/:."):
+            source, crop = item, default_crop
+        if not crop:
+            raise ValueError(f"no crop given for stream {item!r} (write it as source@Crop)")
+        if any(spec.name == name for spec in specs):
+            raise ValueError(f"duplicate stream name {name!r}")
+        specs.append(StreamSpec(name, source.strip(), crop.strip()))
+    return specs
+
+
+def open_source(source):
+    """FrameSource for a device index, "synthetic", a video file or a stream URL"""
+    if source.isdigit():
+        return DeviceSource(indices=(int(source),))
+    if source == "synthetic":
+        return SyntheticSource()
+    if os.path.isfile(source):
+        return VideoFileSource(source)
+    # RTSP/HTTP streams: no looping, and frames are paced by the sender
+    return VideoFileSource(source, loop=False, realtime=False)
+
+
+class CrossStreamScheduler():
+    """One inference thread serving many streams, batched per crop model.
+
+    Each stream has at most one pending frame (a newer one replaces it, as
+    in LatestFrameQueue). The thread takes the crop of the oldest pending
+    frame, collects every pending frame for that crop across all streams
+    (up to max_batch), and classifies them in a single predict_batch call.
+    Frames are preprocessed on the submitting stream's thread, so the
+    scheduler only stacks ready inputs. Streams on the same crop therefore
+    share one model call instead of paying for one each.
+    """
+
+    def __init__(self, registry, max_batch=16, max_wait=0.02, recorder=None, window=2048):
+        self.registry = registry
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.recorder = recorder
+
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._batches = {}
+        self._last_submit = {}
+
+        self.submitted = 0
+        self.replaced = 0
+        self.completed = 0
+        self.errors = 0
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=window)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="minori-scheduler", daemon=True)
+        self._thread.start()
+
+    def _preprocessor(self, target_size):
+        preprocessors = getattr(self._local, "preprocessors", None)
+        if preprocessors is None:
+            preprocessors = self._local.preprocessors = {}
+        preprocessor = preprocessors.get(target_size)
+        if preprocessor is None:
+            preprocessor = preprocessors[target_size] = FramePreprocessor(target_size)
+        return preprocessor
+
+    def submit(self, stream, frame):
+        """Queue frame for stream.spec.crop, replacing that stream's pending frame"""
+        crop = stream.spec.crop
+        detector = self.registry.get(crop)
+        h, w = detector.preprocessor.target_size
+        with TELEMETRY.span("preprocess", crop=crop, stream=stream.spec.name):
+            image = self._preprocessor((h, w)).preprocess_into(frame, np.empty((h, w, 3), dtype=np.float32))
+        # The recorder keeps a thumbnail of the frame; keep it out of the capture ring
+        kept = frame.copy() if self.recorder else None
+
+        with self._cond:
+            self.submitted += 1
+            self._last_submit[stream] = time.perf_counter()
+            if self._pending.pop(stream, None) is not None:
+                self.replaced += 1
+            self._pending[stream] = (stream, crop, image, kept, time.perf_counter())
+            self._cond.notify()
+
+    def _take(self):
+        with self._cond:
+            while not self._pending:
+                if self._stop.is_set():
+                    return None
+                self._cond.wait(0.5)
+            # Give the other recently active streams (a gated stream may be
+            # idle for minutes) a moment to land in the same batch
+            now = time.perf_counter()
+            active = sum(1 for t in self._last_submit.values() if now - t < 1.0)
+            deadline = now + self.max_wait
+            while len(self._pending) < min(active, self.max_batch) and not self._stop.is_set():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+
+            crop = next(iter(self._pending.values()))[1]
+            streams = [stream for stream, item in self._pending.items() if item[1] == crop][:self.max_batch]
+            return crop, [self._pending.pop(stream) for stream in streams]
+
+    def _run(self):
+        while not self._stop.is_set():
+            taken = self._take()
+            if taken is None:
+                break
+            crop, items = taken
+            n = len(items)
+            try:
+                detector = self.registry.get(crop)
+                shape = items[0][2].shape
+                batch = self._batches.get(crop)
+                if batch is None or batch.shape[1:] != shape:
+                    batch = self._batches[crop] = np.empty((self.max_batch,) + shape, dtype=np.float32)
+                for i, item in enumerate(items):
+                    batch[i] = item[2]
+                with TELEMETRY.span("inference", crop=crop, batch=n):
+                    probs = detector.engine.predict_batch(batch[:n])
+            except Exception as e:
+                self.errors += n
+                print(f"[ERROR] {crop} batch of {n} failed: {e}")
+                for stream, *_ in items:
+                    stream.error = e
+                continue
+
+            now = time.perf_counter()
+            self.batch_sizes[n] += 1
+            self.completed += n
+            for (stream, _, _, frame, queued), row in zip(items, probs):
+                label = detector.class_labels[int(np.argmax(row))]
+                scores = dict(zip(detector.class_labels, row.tolist()))
+                self.latencies.append(now - queued)
+                stream.result = StreamResult(label, scores, now - queued, n, time.time())
+                stream.error = None
+                if self.recorder:
+                    self.recorder.record(crop, label, scores, now - queued, frame, stream=stream.spec.name)
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        runs = sum(self.batch_sizes.values())
+        return {
+            "pending": pending,
+            "submitted": self.submitted,
+            "replaced": self.replaced,
+            "completed": self.completed,
+            "errors": self.errors,
+            "mean_batch": self.completed / runs if runs else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "latency_ms": {k: v * 1000 for k, v in percentiles(list(self.latencies), (50, 95)).items()},
+        }
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+class Stream():
+    """One source: its grabber, scene gate, and a feeder thread to the scheduler.
+
+    With gate=True a frame is only submitted when the stream's ROI changed
+    and settled (see SceneChangeGate); otherwise every new frame is, and
+    the scheduler keeps only the latest per stream.
+    """
+
+    def __init__(self, spec, scheduler, source=None, gate=True):
+        self.spec = spec
+        self.scheduler = scheduler
+        self.grabber = CameraGrabber(source or open_source(spec.source))
+        self.gate = SceneChangeGate() if gate else None
+        self.result = None
+        self.error = None
+        self.submitted = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.grabber.start()
+        if self.gate:
+            self.gate.reset()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"minori-feed-{self.spec.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(2.0)
+            self._thread = None
+        self.grabber.stop()
+
+    def _run(self):
+        seq = 0
+        while not self._stop.is_set():
+            packet = self.grabber.wait_for_frame(seq, timeout=0.5)
+            if packet is None:
+                continue
+            seq = packet.seq
+            if self.gate is None or self.gate.update(packet.frame):
+                try:
+                    self.scheduler.submit(self, packet.frame)
+                    self.submitted += 1
+                except Exception as e:
+                    self.error = e
+                    print(f"[ERROR] {self.spec.name}: {e}")
+                    self._stop.wait(1.0)
+
+    def stats(self):
+        return dict(self.grabber.stats(), name=self.spec.name, crop=self.spec.crop, submitted=self.submitted,
+                    label=self.result.label if self.result else None)
+
+
+class TiledPreview():
+    """Compose the latest frame of every stream into one BGR mosaic.
+
+    Tiles are tile_size each, cols wide (default: as square as possible),
+    and carry the detection box, coloured by the stream's last result, and
+    a caption with the stream name, crop and label. The mosaic and tile
+    buffers are reused between calls.
+    """
+
+    def __init__(self, tile_size=(320, 240), cols=None):
+        self.tile_size = tile_size
+        self.cols = cols
+        self._mosaic = None
+        self._tile = np.empty((tile_size[1], tile_size[0], 3), dtype=np.uint8)
+
+    def render(self, streams):
+        n = len(streams)
+        cols = self.cols or int(np.ceil(np.sqrt(n)))
+        rows = int(np.ceil(n / cols))
+        tw, th = self.tile_size
+        if self._mosaic is None or self._mosaic.shape[:2] != (rows * th, cols * tw):
+            self._mosaic = np.zeros((rows * th, cols * tw, 3), dtype=np.uint8)
+
+        x1, y1, x2, y2 = detection_box(th, tw)
+        for i, stream in enumerate(streams):
+            r, c = divmod(i, cols)
+            tile = self._mosaic[r * th:(r + 1) * th, c * tw:(c + 1) * tw]
+            packet = stream.grabber.latest() if stream.grabber.connected else None
+            if packet is None:
+                tile[...] = 0
+                caption = f"{stream.spec.name}: reconnecting..."
+                color = (128, 128, 128)
+            else:
+                cv2.resize(packet.frame, (tw, th), dst=self._tile, interpolation=cv2.INTER_AREA)
+                tile[...] = self._tile
+                result = stream.result
+                if result is None:
+                    caption, color = f"{stream.spec.name} {stream.spec.crop}", (200, 200, 200)
+                else:
+                    healthy = "healthy" in result.label.lower()
+                    color = (0, 255, 0) if healthy else (0, 0, 255)
+                    caption = f"{stream.spec.name} {stream.spec.crop}: {result.label}"
+                cv2.rectangle(tile, (x1, y1), (x2, y2), color, 2)
+            cv2.rectangle(tile, (0, 0), (tw, 22), (0, 0, 0), -1)
+            cv2.putText(tile, caption, (6, 16), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
+        return self._mosaic
+
+
+class MultiStreamApp():
+    """Tk window with the tiled preview of every stream and scheduler stats"""
+
+    def __init__(self, root, streams, scheduler, preview=None):
+        import tkinter as tk
+        from renderer import FramePacer, FrameRenderer
+
+        self.root = root
+        self.streams = streams
+        self.scheduler = scheduler
+        self.preview = preview or TiledPreview()
+
+        root.title(f"Minori AI - {len(streams)} streams")
+        root.configure(bg='#2c3e50')
+        self.preview_label = tk.Label(root, bg='#34495e')
+        self.preview_label.pack(fill='both', expand=True, padx=5, pady=5)
+        self.stats_label = tk.Label(root, font=('Courier', 9), fg='#bdc3c7', bg='#2c3e50', justify='left')
+        self.stats_label.pack(fill='x', padx=5, pady=(0, 5))
+        self.renderer = FrameRenderer(self.preview_label)
+        self.pacer = FramePacer(target_fps=15)
+
+        for stream in streams:
+            stream.start()
+        self.update_preview()
+
+    def update_preview(self):
+        self.pacer.begin()
+        self.renderer.render(self.preview.render(self.streams))
+        stats = self.scheduler.stats()
+        self.stats_label.config(text=(
+            f"Scheduler: {stats['completed']} classified, mean batch {stats['mean_batch']:.1f}, "
+            f"latency p50 {stats['latency_ms']['p50']:.0f} ms, {stats['replaced']} replaced\n"
+            + "  ".join(f"{s.spec.name} {s.grabber.fps:.0f} fps" for s in self.streams)
+        ))
+        self.root.after(self.pacer.next_delay(), self.update_preview)
+
+    def cleanup(self):
+        for stream in self.streams:
+            stream.stop()
+        self.scheduler.stop()
+
+
+def make_registry():
+    """CropModelRegistry configured from the same MINORI_* settings as the app"""
+    from crop_models import CropModelRegistry
+
+    return CropModelRegistry.from_env()
+
+
+def scaling_benchmark(crop, max_streams=4, seconds=10.0, fps=30.0, max_batch=16, max_wait=0.02):
+    """CPU cost per stream count with ungated synthetic streams on one crop.
+
+    Prints frames classified per second and CPU seconds per wall second
+    for 1..max_streams streams, so a batched scheduler should show CPU
+    growing more slowly than the stream count.
+    """
+    registry = make_registry()
+    registry.get(crop)
+    results = []
+    for n in range(1, max_streams + 1):
+        scheduler = CrossStreamScheduler(registry, max_batch, max_wait)
+        streams = [Stream(StreamSpec(f"stream{i}", "synthetic", crop), scheduler,
+                          SyntheticSource(fps=fps), gate=False) for i in range(n)]
+        for stream in streams:
+            stream.start()
+        time.sleep(1.0)
+        done, cpu, wall = scheduler.completed, time.process_time(), time.perf_counter()
+        time.sleep(seconds)
+        done, cpu, wall = scheduler.completed - done, time.process_time() - cpu, time.perf_counter() - wall
+        stats = scheduler.stats()
+        for stream in streams:
+            stream.stop()
+        scheduler.stop()
+
+        result = {"streams": n, "classified_per_second": done / wall, "cpu_per_second": cpu / wall,
+                  "cpu_ms_per_frame": cpu * 1000 / done if done else 0.0,
+                  "mean_batch": stats["mean_batch"], "latency_p50_ms": stats["latency_ms"]["p50"]}
+        results.append(result)
+        print(f"[INFO] {n} streams: {result['classified_per_second']:.1f} frames/s, "
+              f"CPU {result['cpu_per_second']:.2f} s/s (x{result['cpu_per_second'] / results[0]['cpu_per_second']:.2f}, "
+              f"{result['cpu_ms_per_frame']:.1f} ms/frame), "
+              f"mean batch {result['mean_batch']:.2f}, p50 {result['latency_p50_ms']:.1f} ms")
+    registry.shutdown()
+    return results
+
+
+def main(streams_text=None, gate=True, max_batch=16, max_wait=0.02):
+    """Open the multi-stream window for MINORI_STREAMS (or streams_text)"""
+    import tkinter as tk
+    from session_recorder import SessionRecorder
+
+    specs = parse_streams(streams_text or os.getenv("MINORI_STREAMS"))
+    if not specs:
+        raise SystemExit("[ERROR] No streams configured (set MINORI_STREAMS, e.g. 0@Rice,1@Wheat)")
+    registry = make_registry()
+    for crop in {spec.crop for spec in specs}:
+        registry.prefetch(crop)
+    recorder = SessionRecorder() if os.getenv("MINORI_SESSION_RECORD", "1") != "0" else None
+    scheduler = CrossStreamScheduler(registry, max_batch, max_wait, recorder)
+    streams = [Stream(spec, scheduler, gate=gate) for spec in specs]
+
+    root = tk.Tk()
+    app = MultiStreamApp(root, streams, scheduler)
+
+    def on_closing():
+        print("[INFO] Shutting down...")
+        app.cleanup()
+        registry.shutdown()
+        if recorder:
+            recorder.close()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    try:
+        root.mainloop()
+    except KeyboardInterrupt:
+        on_closing()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Several cameras sharing crop models, batched across streams")
+    parser.add_argument("streams", nargs="?", help="e.g. 0@Rice,trays.mp4@Wheat,rtsp://cam/2@Rice "
+                                                   "(default: MINORI_STREAMS)")
+    parser.add_argument("--no-gate", action="store_true", help="classify every frame, not only settled scenes")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=20.0, help="how long a batch waits for other streams")
+    parser.add_argument("--bench", metavar="CROP", help="measure CPU scaling with synthetic streams instead")
+    parser.add_argument("--bench-streams", type=int, default=4)
+    parser.add_argument("--bench-seconds", type=float, default=10.0)
+    parser.add_argument("--bench-fps", type=float, default=30.0, help="frame rate of each synthetic stream")
+    args = parser.parse_args()
+
+    if args.bench:
+        scaling_benchmark(args.bench, args.bench_streams, args.bench_seconds, args.bench_fps, args.max_batch,
+                          args.max_wait_ms / 1000)
+    else:
+        main(args.streams, not args.no_gate, args.max_batch, args.max_wait_ms / 1000)
@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def content_hash(image):
+    """128-bit digest of the exact bytes of a model input"""
+    data = np.ascontiguousarray(image).tobytes()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=16).digest(), "big")
+
+
+def dhash(image, hash_size=16):
+    """Difference hash (hash_size**2 bits) of a preprocessed (H, W, 3) model input.
+
+    The image is reduced to a (hash_size x hash_size+1) grayscale grid and
+    each bit records whether a cell is brighter than its right neighbour,
+    so small noise or exposure changes flip few bits.
+    """
+    if image.ndim == 4:
+        image = image[0]
+    gray = image.mean(axis=2, dtype=np.float32) if image.ndim == 3 else image.astype(np.float32)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PredictionCache():
+    """Bounded LRU cache of class probabilities keyed by (crop, model version, hash).
+
+    By default the hash is a digest of the exact input bytes, so only a
+    repeated identical frame is a hit. With max_distance > 0 it is a
+    hash_size x hash_size dHash instead, and a lookup that misses the exact
+    key takes any entry for the same crop and model version within
+    max_distance bits. That is opt-in: a few small lesions on a leaf can
+    change no more bits than sensor noise, so a near hit can return a
+    healthy leaf's prediction for a diseased one. Entries for an old model
+    version are dropped by invalidate().
+    """
+
+    def __init__(self, max_entries=256, max_distance=0, hash_size=16):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def hash(self, image):
+        if self.max_distance > 0:
+            return dhash(image, self.hash_size)
+        return content_hash(image)
+
+    def get(self, crop, version, image_hash):
+        with self._lock:
+            key = (crop, version, image_hash)
+            probs = self._entries.get(key)
+
+            if probs is None and self.max_distance > 0:
+                best = self.max_distance + 1
+                for (c, v, h), cached in self._entries.items():
+                    if c == crop and v == version:
+                        distance = bin(h ^ image_hash).count("1")
+                        if distance < best:
+                            best, key, probs = distance, (c, v, h), cached
+                if probs is not None:
+                    self.near_hits += 1
+
+            if probs is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return probs.copy()
+
+    def put(self, crop, version, image_hash, probs):
+        with self._lock:
+            key = (crop, version, image_hash)
+            self._entries[key] = np.array(probs, copy=True)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, crop, keep_version=None):
+        """Drop every entry for crop except those of keep_version"""
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == crop and k[1] != keep_version]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
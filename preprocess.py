@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+
+INPUT_SIZE = (128, 128)
+
+
+class FramePreprocessor():
+    """Turn BGR camera frames into model input without touching the disk.
+
+    All intermediate buffers are allocated once and reused, so a detection
+    costs one resize, one colour conversion and one scaling pass.
+    """
+
+    def __init__(self, target_size=INPUT_SIZE, interpolation=cv2.INTER_NEAREST_EXACT):
+        self.target_size = target_size
+        # Keras' load_img defaults to PIL nearest-neighbour (which is what
+        # INTER_NEAREST_EXACT reproduces); the models were trained with it.
+        self.interpolation = interpolation
+
+        h, w = target_size
+        self._resized = np.empty((h, w, 3), dtype=np.uint8)
+        self._rgb = np.empty((h, w, 3), dtype=np.uint8)
+        self.input_buffer = np.empty((1, h, w, 3), dtype=np.float32)
+
+    def preprocess(self, frame):
+        """Resize, convert BGR->RGB and scale to [0, 1] into the input buffer"""
+        self.preprocess_into(frame, self.input_buffer[0])
+        return self.input_buffer
+
+    def preprocess_batch(self, frames, out=None):
+        """Preprocess several frames into one (N, H, W, 3) float32 batch"""
+        h, w = self.target_size
+        if out is None or out.shape[0] < len(frames):
+            out = np.empty((len(frames), h, w, 3), dtype=np.float32)
+        for i, frame in enumerate(frames):
+            self.preprocess_into(frame, out[i])
+        return out[:len(frames)]
+
+    def preprocess_into(self, frame, out):
+        """Preprocess one frame into out, an (H, W, 3) float32 array"""
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        elif frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+        h, w = self.target_size
+        cv2.resize(frame, (w, h), dst=self._resized, interpolation=self.interpolation)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        np.multiply(self._rgb, np.float32(1.0 / 255.0), out=out, casting='unsafe')
+        return out
+
+
+def load_frame(path):
+    """Read an image file as a BGR array"""
+    frame = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError(f"Could not read image: {path}")
+    return frame
+
+
+def as_frame(frame):
+    """Accept either a BGR ndarray or a path to an image file"""
+    if isinstance(frame, np.ndarray):
+        return frame
+    return load_frame(frame)
@@ -0,0 +1,15 @@
+import hashlib
+
+
+SYSTEM_PROMPT = "You are an expert agriculture consultant. Use the provided context to answer the question accurately. If the context does not contain relevant information, respond with 'I don't know'."
+USER_PROMPT = "Based on the following context, please provide information about the crop and disease. If the context does not contain relevant information, respond with 'I don't know'.\n\nContext: {context}\n\nQuestion: {input}"
+QUESTION = "Please tell the solution according to the official methods present in the context for the following crop and disease. Crop: {}, Disease: {}"
+
+
+def prompt_hash():
+    """Short hash of every template that shapes an answer"""
+    digest = hashlib.sha256()
+    for text in (SYSTEM_PROMPT, USER_PROMPT, QUESTION):
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
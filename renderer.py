@@ -0,0 +1,192 @@
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+from telemetry import TELEMETRY
+
+
+def detection_box(h, w):
+    """Centered square box (x1, y1, x2, y2) used for the detection overlay"""
+    box_size = min(h, w) // 2
+    x1 = (w - box_size) // 2
+    y1 = (h - box_size) // 2
+    return x1, y1, x1 + box_size, y1 + box_size
+
+
+def draw_detection_overlay(frame, is_healthy):
+    """Draw the detection box, corner markers and label onto frame in place"""
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = detection_box(h, w)
+
+    # Color based on health status
+    color = (0, 255, 0) if is_healthy else (0, 0, 255)  # Green/Red
+
+    # Draw main box with thicker border
+    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 4)
+
+    # Add corner markers for a more professional look
+    corner_length = 30
+    cv2.line(frame, (x1, y1), (x1 + corner_length, y1), color, 6)
+    cv2.line(frame, (x1, y1), (x1, y1 + corner_length), color, 6)
+    cv2.line(frame, (x2, y1), (x2 - corner_length, y1), color, 6)
+    cv2.line(frame, (x2, y1), (x2, y1 + corner_length), color, 6)
+    cv2.line(frame, (x1, y2), (x1 + corner_length, y2), color, 6)
+    cv2.line(frame, (x1, y2), (x1, y2 - corner_length), color, 6)
+    cv2.line(frame, (x2, y2), (x2 - corner_length, y2), color, 6)
+    cv2.line(frame, (x2, y2), (x2, y2 - corner_length), color, 6)
+
+    # Add label
+    label = "HEALTHY" if is_healthy else "DISEASE DETECTED"
+    font_scale = 0.8
+    thickness = 2
+
+    (text_w, text_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+
+    # Label background
+    cv2.rectangle(frame, (x1, y1 - text_h - 15), (x1 + text_w + 10, y1 - 5), color, -1)
+
+    # Label text
+    cv2.putText(frame, label, (x1 + 5, y1 - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
+
+    return frame
+
+
+class OverlayCache():
+    """Pre-rendered detection overlays keyed by (state, source size, output size).
+
+    The overlay is drawn once at the camera resolution, so it looks exactly
+    like the old per-frame drawing, then scaled to the display size. Only
+    the bounding rectangle of what was drawn is kept, as an RGB patch, a
+    per-channel boolean mask (a broadcast (H, W, 1) mask sends np.copyto
+    down a slow path) and the patch's (y0, y1, x0, x1) in the output, or
+    None when the output is so small that nothing of the overlay survives.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._layers = {}
+
+    def get(self, is_healthy, frame_size, out_size):
+        key = (is_healthy, frame_size, out_size)
+        layer = self._layers.get(key)
+        if layer is None:
+            if len(self._layers) >= self.max_entries:
+                self._layers.pop(next(iter(self._layers)))
+            layer = self._layers[key] = self._render(is_healthy, frame_size, out_size)
+        return layer
+
+    def _render(self, is_healthy, frame_size, out_size):
+        fw, fh = frame_size
+        ow, oh = out_size
+
+        # Every overlay colour is non-black, so the alpha mask is simply
+        # whatever got drawn on a black canvas.
+        canvas = np.zeros((fh, fw, 3), dtype=np.uint8)
+        draw_detection_overlay(canvas, is_healthy)
+        mask = cv2.cvtColor(canvas, cv2.COLOR_BGR2GRAY)
+
+        if (ow, oh) != (fw, fh):
+            canvas = cv2.resize(canvas, (ow, oh), interpolation=cv2.INTER_NEAREST)
+            mask = cv2.resize(mask, (ow, oh), interpolation=cv2.INTER_NEAREST)
+
+        if not mask.any():
+            return None
+        ys, xs = np.nonzero(mask)
+        y0, y1, x0, x1 = int(ys.min()), int(ys.max()) + 1, int(xs.min()), int(xs.max()) + 1
+        rgb = cv2.cvtColor(canvas[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+        alpha = np.repeat((mask[y0:y1, x0:x1] > 0)[:, :, None], 3, axis=2)
+        return rgb, alpha, (y0, y1, x0, x1)
+
+
+class FrameRenderer():
+    """Show BGR frames in a Tk label with as little work per frame as possible.
+
+    - the label size is cached and only refreshed on <Configure>
+    - frames are resized with INTER_LINEAR into a reused buffer
+    - a single PhotoImage is kept and updated with paste()
+    - the detection overlay comes pre-rendered from an OverlayCache
+    """
+
+    def __init__(self, label, padding=10, interpolation=cv2.INTER_LINEAR):
+        self.label = label
+        self.padding = padding
+        self.interpolation = interpolation
+        self.overlays = OverlayCache()
+
+        self.target_size = None
+        self._resized = None
+        self._rgb = None
+        self._photo = None
+        self._photo_size = None
+
+        label.bind("<Configure>", self._on_configure, add="+")
+
+    def _on_configure(self, event):
+        w = event.width - self.padding
+        h = event.height - self.padding
+        self.target_size = (w, h) if w > 1 and h > 1 else None
+
+    def render(self, frame, overlay=None):
+        """Display frame; overlay is None or the is_healthy flag to draw"""
+        with TELEMETRY.span("render"):
+            fh, fw = frame.shape[:2]
+            out_w, out_h = self.target_size or (fw, fh)
+
+            if self._resized is None or self._resized.shape[:2] != (out_h, out_w):
+                self._resized = np.empty((out_h, out_w, 3), dtype=np.uint8)
+                self._rgb = np.empty((out_h, out_w, 3), dtype=np.uint8)
+
+            if (out_w, out_h) != (fw, fh):
+                cv2.resize(frame, (out_w, out_h), dst=self._resized, interpolation=self.interpolation)
+                cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+            else:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+
+            layer = self.overlays.get(overlay, (fw, fh), (out_w, out_h)) if overlay is not None else None
+            if layer is not None:
+                rgb, mask, (y0, y1, x0, x1) = layer
+                np.copyto(self._rgb[y0:y1, x0:x1], rgb, where=mask)
+
+            img = Image.fromarray(self._rgb)
+            if self._photo is None or self._photo_size != (out_w, out_h):
+                self._photo = ImageTk.PhotoImage(img)
+                self._photo_size = (out_w, out_h)
+                self.label.configure(image=self._photo, text="")
+                self.label.image = self._photo
+            else:
+                self._photo.paste(img)
+
+    def reset(self):
+        """Forget the PhotoImage, e.g. after the label was showing text"""
+        self._photo = None
+        self._photo_size = None
+
+
+class FramePacer():
+    """Pick the delay until the next preview tick.
+
+    Instead of a fixed 30 ms after the work is done, the loop aims at the
+    slower of the target rate and the camera rate, subtracting the time
+    the last tick itself took.
+    """
+
+    def __init__(self, target_fps=30.0, min_delay_ms=5, max_delay_ms=100):
+        self.target_fps = target_fps
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self._tick_start = time.perf_counter()
+        self.work_ms = 0.0
+
+    def begin(self):
+        self._tick_start = time.perf_counter()
+
+    def next_delay(self, source_fps=None):
+        """Milliseconds to wait before the next tick"""
+        self.work_ms = (time.perf_counter() - self._tick_start) * 1000
+        fps = self.target_fps
+        if source_fps and source_fps > 0:
+            fps = min(fps, source_fps)
+        delay = 1000.0 / fps - self.work_ms
+        return int(min(self.max_delay_ms, max(self.min_delay_ms, delay)))
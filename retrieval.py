@@ -0,0 +1,217 @@
+import math
+import re
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.documents import Document
+from telemetry import TELEMETRY
+
+
+GENERAL = "general"
+
+
+def disease_words(label):
+    """'YellowRust' / 'Leaf_scald' -> 'yellow rust' / 'leaf scald'"""
+    spaced = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", str(label)).replace("_", " ")
+    return " ".join(spaced.split()).lower()
+
+
+def estimate_tokens(text):
+    """Rough LLM token count (~4 characters per token for English)"""
+    return math.ceil(len(text) / 4)
+
+
+class ChunkTagger():
+    """Attach 'crop' and 'diseases' metadata to chunks.
+
+    The crop is taken from the source path (a 'Wheat/' folder or
+    'Disease-Management-in-Wheat.pdf') and otherwise from whichever known
+    crop the chunk mentions most; chunks naming no crop are GENERAL.
+    Diseases are the known labels of that crop mentioned in the text.
+    """
+
+    def __init__(self, labels=None):
+        if labels is None:
+            from answer_cache import known_diseases
+            labels = known_diseases()
+        self.diseases = OrderedDict()
+        for crop, disease in labels:
+            self.diseases.setdefault(crop.lower(), []).append(disease_words(disease))
+        self.crops = list(self.diseases)
+
+    def crop_of(self, source, text):
+        path = re.split(r"[\\/_\-\s.]+", str(source).lower())
+        for crop in self.crops:
+            if crop in path:
+                return crop
+        lowered = text.lower()
+        counts = {crop: len(re.findall(rf"\b{re.escape(crop)}\b", lowered)) for crop in self.crops}
+        best = max(counts, key=counts.get, default=None)
+        return best if best and counts[best] else GENERAL
+
+    def tag(self, doc):
+        crop = self.crop_of(doc.metadata.get("source", ""), doc.page_content)
+        lowered = " ".join(doc.page_content.lower().split())
+        candidates = self.diseases.get(crop) or [d for names in self.diseases.values() for d in names]
+        doc.metadata["crop"] = crop
+        doc.metadata["diseases"] = [d for d in candidates if d in lowered]
+        return doc
+
+
+class BM25Index():
+    """Okapi BM25 over a fixed list of texts, scored with one sparse product.
+
+    Per-term weights idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avglen))
+    are precomputed into a (docs x terms) matrix, so scoring a query is a
+    matrix-vector product over the query's terms.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        self.vectorizer = CountVectorizer(stop_words="english", dtype=np.float32)
+        tf = self.vectorizer.fit_transform(texts).tocsr()
+        n_docs = tf.shape[0]
+
+        lengths = np.asarray(tf.sum(axis=1)).ravel()
+        avg = lengths.mean() if n_docs else 1.0
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        row_norm = k1 * (1 - b + b * lengths / max(avg, 1e-9))
+        rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        tf.data = idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + row_norm[rows])
+        self.weights = tf
+
+    def scores(self, query):
+        q = self.vectorizer.transform([query])
+        q.data[:] = 1.0
+        return np.asarray((self.weights @ q.T).todense()).ravel()
+
+
+def _overlap(a, b, min_chars, max_chars):
+    """Length of the longest suffix of a that is a prefix of b (0 if < min_chars)"""
+    for n in range(min(len(a), len(b), max_chars), min_chars - 1, -1):
+        if a[-n:] == b[:n]:
+            return n
+    return 0
+
+
+def pack_context(docs, token_budget=1500, min_overlap=40, max_overlap=400, count_tokens=estimate_tokens):
+    """Fit docs (best first) into token_budget, removing repeated text.
+
+    Exact duplicates and chunks contained in an already packed one are
+    dropped. Text shared with a packed neighbour of the same source, which
+    the splitter's chunk_overlap creates, is trimmed from the new chunk.
+    The last chunk that does not fit is cut to the remaining budget.
+    """
+    packed, used = [], 0
+    for doc in docs:
+        text = doc.page_content.strip()
+        source = doc.metadata.get("source")
+        for other in packed:
+            if not text:
+                break
+            if text in other.page_content:
+                text = ""
+            elif other.metadata.get("source") == source:
+                head = _overlap(other.page_content, text, min_overlap, max_overlap)
+                text = text[head:].lstrip()
+                tail = _overlap(text, other.page_content, min_overlap, max_overlap)
+                text = text[:len(text) - tail].rstrip()
+        if not text:
+            continue
+
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining < 32:
+                break
+            text = text[:remaining * 4].rstrip()
+            tokens = count_tokens(text)
+        packed.append(Document(page_content=text, metadata=dict(doc.metadata)))
+        used += tokens
+        if used >= token_budget:
+            break
+    return packed
+
+
+class HybridRetriever():
+    """Crop-filtered vector search fused with BM25, packed into a token budget.
+
+    Both rankings are restricted to chunks of the question's crop (plus
+    GENERAL ones) - the vector side through a FAISS ID selector, so it is a
+    true filtered search rather than post-filtering a global top-k - and
+    combined with reciprocal rank fusion. A crop the index holds nothing
+    about only gets GENERAL chunks (possibly none) rather than another
+    crop's advice; with no crop every chunk is searched.
+    """
+
+    def __init__(self, vector_store, tagger=None, k=6, fetch_k=20, rrf_k=60, token_budget=1500):
+        import faiss
+
+        self.store = vector_store
+        self.k = k
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+        self.token_budget = token_budget
+
+        ids = [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
+        self.docs = [vector_store.docstore.search(doc_id) for doc_id in ids]
+        if any("crop" not in doc.metadata for doc in self.docs):
+            # Indexes built before chunks were tagged
+            tagger = tagger or ChunkTagger()
+            for doc in self.docs:
+                if "crop" not in doc.metadata:
+                    tagger.tag(doc)
+
+        self.bm25 = BM25Index([doc.page_content for doc in self.docs])
+        crops = np.array([doc.metadata["crop"] for doc in self.docs])
+        self.rows = {crop: np.flatnonzero((crops == crop) | (crops == GENERAL)) for crop in set(crops.tolist())}
+        self.rows.setdefault(GENERAL, np.flatnonzero(crops == GENERAL))
+        self.selectors = {crop: faiss.IDSelectorBatch(rows.astype(np.int64)) for crop, rows in self.rows.items()}
+        self._faiss = faiss
+
+    def _shard(self, crop):
+        return None if crop is None else crop if crop in self.rows else GENERAL
+
+    def _vector_ranking(self, query, shard):
+        if shard is not None and not len(self.rows[shard]):
+            return []
+        with TELEMETRY.span("embedding", texts=1):
+            vector = np.asarray([self.store.embedding_function.embed_query(query)], dtype=np.float32)
+        if self.store._normalize_L2:
+            self._faiss.normalize_L2(vector)
+        params = None
+        if shard is not None:
+            params = self._faiss.SearchParameters(sel=self.selectors[shard])
+        _, found = self.store.index.search(vector, self.fetch_k, params=params)
+        return [int(i) for i in found[0] if i >= 0]
+
+    def _lexical_ranking(self, query, shard):
+        scores = self.bm25.scores(query)
+        if shard is not None:
+            rows = self.rows[shard]
+            mask = np.full(len(scores), -np.inf, dtype=np.float32)
+            mask[rows] = 0.0
+            scores = scores + mask
+        order = np.argsort(-scores)[:self.fetch_k]
+        return [int(i) for i in order if scores[i] > 0]
+
+    def retrieve(self, query, crop=None, disease=None):
+        """Packed context documents for query, restricted to crop if given"""
+        with TELEMETRY.span("retrieval", crop=crop):
+            return self._retrieve(query, crop, disease)
+
+    def _retrieve(self, query, crop, disease):
+        crop = crop.lower() if crop else None
+        keywords = " ".join(filter(None, [crop, disease_words(disease) if disease else None])) or query
+
+        fused = {}
+        shard = self._shard(crop)
+        for ranking in (self._vector_ranking(query, shard), self._lexical_ranking(keywords, shard)):
+            for rank, row in enumerate(ranking):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        best = sorted(fused, key=fused.get, reverse=True)[:self.k]
+        return pack_context([self.docs[row] for row in best], self.token_budget)
@@ -0,0 +1,100 @@
+import time
+
+import cv2
+import numpy as np
+from renderer import detection_box
+
+
+class SceneChangeGate():
+    """Decide when continuous detection should actually run the model.
+
+    Each frame's central ROI (the box drawn by draw_detection_overlay) is
+    shrunk to a small grayscale thumbnail. Inference is triggered once the
+    ROI differs from the last analysed one by more than change_threshold
+    and has then held still (frame-to-frame difference below
+    stable_threshold) for stable_frames frames. While nothing changes no
+    inference runs at all. Differences are mean absolute grey levels (0-255).
+    """
+
+    def __init__(self, change_threshold=12.0, stable_threshold=4.0, stable_frames=3,
+                 size=(32, 32), legacy_interval=3.0):
+        self.change_threshold = change_threshold
+        self.stable_threshold = stable_threshold
+        self.stable_frames = stable_frames
+        self.size = size
+        # Only used to report how many runs the old fixed cooldown would have made
+        self.legacy_interval = legacy_interval
+
+        self.frames = 0
+        self.triggers = 0
+        self._saved_before = 0
+        self._active_since = None
+        self._base_triggers = 0
+        self._clear()
+
+    def _clear(self):
+        self._reference = None
+        self._previous = None
+        self._pending = True
+        self._stable = 0
+
+    def reset(self):
+        """Forget the analysed scene (the next stable frame triggers) and
+        start counting saved runs"""
+        self.stop()
+        self._clear()
+        self._active_since = time.time()
+        self._base_triggers = self.triggers
+
+    def stop(self):
+        """Stop counting saved runs until the next reset()"""
+        self._saved_before += self._saved_this_run()
+        self._active_since = None
+
+    def thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = detection_box(h, w)
+        small = cv2.resize(frame[y1:y2, x1:x2], self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    def update(self, frame):
+        """Feed a frame; returns True when inference should run on it"""
+        self.frames += 1
+        current = self.thumbnail(frame)
+
+        motion = float(np.mean(np.abs(current - self._previous))) if self._previous is not None else 0.0
+        self._previous = current
+
+        if self._reference is not None and not self._pending:
+            change = float(np.mean(np.abs(current - self._reference)))
+            if change > self.change_threshold:
+                self._pending = True
+                self._stable = 0
+
+        if not self._pending:
+            return False
+
+        self._stable = self._stable + 1 if motion < self.stable_threshold else 0
+        if self._stable < self.stable_frames:
+            return False
+
+        self._reference = current
+        self._pending = False
+        self._stable = 0
+        self.triggers += 1
+        return True
+
+    def _saved_this_run(self):
+        if self._active_since is None:
+            return 0
+        expected = int((time.time() - self._active_since) / self.legacy_interval)
+        return max(0, expected - (self.triggers - self._base_triggers))
+
+    def saved(self):
+        """Runs the old fixed cooldown would have made minus runs actually made"""
+        return self._saved_before + self._saved_this_run()
+
+    def stats(self):
+        return {"frames": self.frames, "triggers": self.triggers, "saved": self.saved()}
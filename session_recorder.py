@@ -0,0 +1,255 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from renderer import detection_box
+
+
+SESSION_DIR = "session_data"
+
+
+def session_parts(directory=SESSION_DIR):
+    """Every session .jsonl file in directory, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, "session_*.jsonl")))
+
+
+def roi_thumbnail(frame, size=(64, 64)):
+    """Downsampled copy of the detection box region of a BGR frame"""
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = detection_box(h, w)
+    return cv2.resize(frame[y1:y2, x1:x2], size, interpolation=cv2.INTER_AREA)
+
+
+class SessionRecorder():
+    """Append every detection to session_data/ and keep recent ones in memory.
+
+    Each record is one JSON line in session_<start>[_NNN].jsonl. Optional ROI
+    thumbnails are JPEG bytes appended to the matching .thumbs file, and the
+    record stores their (offset, length). Both files are only ever appended
+    to, thumbnail first, so a crash can at worst leave a torn last line or
+    unreferenced thumbnail bytes, which readers skip. Writes happen on a
+    background thread that fsyncs every flush_records records or
+    flush_interval seconds. A part is closed and a new one started once it
+    passes max_bytes. The last `history` records stay in a ring buffer for
+    the UI.
+    """
+
+    def __init__(self, directory=SESSION_DIR, history=100, max_bytes=50 * 1024 * 1024,
+                 thumbnails=True, thumbnail_size=(64, 64), flush_interval=1.0, flush_records=64,
+                 queue_size=4096):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.thumbnails = thumbnails
+        self.thumbnail_size = thumbnail_size
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+
+        self.stem = time.strftime("session_%Y%m%d_%H%M%S")
+        self.part = 0
+        self.seq = 0
+        self.written = 0
+        self.dropped = 0
+        self.fsyncs = 0
+
+        self._history = deque(maxlen=history)
+        self._history_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jsonl = None
+        self._thumbs = None
+        self._thread = threading.Thread(target=self._run, name="minori-session", daemon=True)
+        self._thread.start()
+
+    def record(self, crop, label, probs, latency, frame=None, **extra):
+        """Queue one detection; never blocks (records are dropped if the writer is stuck)"""
+        self.seq += 1
+        record = {
+            "ts": round(time.time(), 3),
+            "seq": self.seq,
+            "crop": crop,
+            "label": label,
+            "probs": {k: round(float(v), 6) for k, v in probs.items()},
+            "latency_ms": round(latency * 1000, 3),
+            **extra,
+        }
+        with self._history_lock:
+            self._history.append(record)
+
+        thumbnail = roi_thumbnail(frame, self.thumbnail_size) if frame is not None and self.thumbnails else None
+        try:
+            self._queue.put_nowait((record, thumbnail))
+        except queue.Full:
+            self.dropped += 1
+        return record
+
+    def recent(self, n=None):
+        """Newest-last list of the last n (default all buffered) records"""
+        with self._history_lock:
+            items = list(self._history)
+        return items[-n:] if n else items
+
+    def stats(self):
+        return {"recorded": self.seq, "written": self.written, "dropped": self.dropped,
+                "fsyncs": self.fsyncs, "pending": self._queue.qsize(), "part": self.path}
+
+    @property
+    def path(self):
+        suffix = f"_{self.part:03d}" if self.part else ""
+        return os.path.join(self.directory, f"{self.stem}{suffix}.jsonl")
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._jsonl = open(self.path, "ab")
+        self._thumbs = open(self.path[:-len(".jsonl")] + ".thumbs", "ab") if self.thumbnails else None
+
+    def _sync(self):
+        for f in (self._thumbs, self._jsonl):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        self.fsyncs += 1
+
+    def _rotate_if_full(self):
+        size = self._jsonl.tell() + (self._thumbs.tell() if self._thumbs else 0)
+        if size >= self.max_bytes:
+            self._sync()
+            self._close_files()
+            self.part += 1
+            self._open()
+
+    def _close_files(self):
+        for f in (self._thumbs, self._jsonl):
+            if f is not None:
+                f.close()
+        self._jsonl = self._thumbs = None
+
+    def _write(self, record, thumbnail):
+        if self._jsonl is None:
+            self._open()
+        if thumbnail is not None and self._thumbs is not None:
+            ok, jpeg = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if ok:
+                offset = self._thumbs.tell()
+                self._thumbs.write(jpeg.tobytes())
+                record = dict(record, thumb=[offset, len(jpeg)])
+        self._jsonl.write(json.dumps(record).encode("utf-8") + b"\n")
+        self.written += 1
+
+    def _run(self):
+        unsynced = 0
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+
+            if item:
+                self._write(*item)
+                unsynced += 1
+            if unsynced and (item is None or unsynced >= self.flush_records
+                             or time.monotonic() - last_sync >= self.flush_interval):
+                self._sync()
+                self._rotate_if_full()
+                unsynced, last_sync = 0, time.monotonic()
+            if item is None:
+                break
+        self._close_files()
+
+    def close(self):
+        """Write and fsync everything queued, then close the files"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def iter_records(paths=None, crop=None, label=None, since=None, until=None, thumbnails=False):
+    """Stream records from session files, oldest first, without loading them whole.
+
+    crop/label filter by exact match (label case-insensitively), since/until
+    by unix time. Lines are pre-screened as raw bytes before JSON parsing,
+    and torn lines from a crash are skipped. With thumbnails=True each
+    record gets "thumbnail": the decoded BGR image (or None).
+    """
+    crop_key = json.dumps(crop).encode("utf-8") if crop else None
+    for path in (session_parts() if paths is None else paths):
+        thumbs = None
+        thumbs_path = path[:-len(".jsonl")] + ".thumbs"
+        if thumbnails and os.path.exists(thumbs_path):
+            thumbs = open(thumbs_path, "rb")
+        try:
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n") or (crop_key and crop_key not in line):
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if crop and record.get("crop") != crop:
+                        continue
+                    if label and record.get("label", "").lower() != label.lower():
+                        continue
+                    if since and record["ts"] < since or until and record["ts"] > until:
+                        continue
+                    if thumbnails:
+                        record["thumbnail"] = read_thumbnail(thumbs, record.get("thumb"))
+                    yield record
+        finally:
+            if thumbs is not None:
+                thumbs.close()
+
+
+def read_thumbnail(thumbs, ref):
+    if thumbs is None or not ref:
+        return None
+    offset, length = ref
+    thumbs.seek(offset)
+    data = thumbs.read(length)
+    if len(data) < length:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    parser = argparse.ArgumentParser(description="Filter and summarise recorded detection sessions")
+    parser.add_argument("paths", nargs="*", help=f"session .jsonl files (default: all in {SESSION_DIR}/)")
+    parser.add_argument("--crop")
+    parser.add_argument("--label")
+    parser.add_argument("--since", type=float, help="unix time")
+    parser.add_argument("--until", type=float, help="unix time")
+    parser.add_argument("--jsonl", action="store_true", help="print matching records instead of a summary")
+    parser.add_argument("--export-thumbs", metavar="DIR", help="write matching thumbnails as JPEG files")
+    args = parser.parse_args()
+
+    if args.export_thumbs:
+        os.makedirs(args.export_thumbs, exist_ok=True)
+    labels = Counter()
+    latencies = []
+    records = iter_records(args.paths or None, args.crop, args.label, args.since, args.until,
+                           thumbnails=bool(args.export_thumbs))
+    for record in records:
+        thumbnail = record.pop("thumbnail", None)
+        if thumbnail is not None:
+            cv2.imwrite(os.path.join(args.export_thumbs, f"{record['ts']:.3f}_{record['seq']}_{record['label']}.jpg"),
+                        thumbnail)
+        if args.jsonl:
+            print(json.dumps(record))
+        labels[(record["crop"], record["label"])] += 1
+        latencies.append(record["latency_ms"])
+
+    if not args.jsonl:
+        print(f"{sum(labels.values())} detections")
+        for (crop, label), count in labels.most_common():
+            print(f"  {crop:<10} {label:<30} {count}")
+        if latencies:
+            p50, p95 = np.percentile(latencies, (50, 95))
+            print(f"latency p50 {p50:.1f} ms, p95 {p95:.1f} ms")
@@ -0,0 +1,81 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer():
+    """Collect how long each startup phase takes.
+
+    Times are measured from when this module was first imported, which
+    main.py does before anything heavy, so the report shows both the
+    duration of each phase and when it finished relative to launch.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, **info):
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.phases.append({
+                    "phase": name,
+                    "seconds": end - start,
+                    "at": end - self.t0,
+                    **info,
+                })
+
+    def mark(self, name, **info):
+        """Record an instant (e.g. 'window shown') with no duration"""
+        with self._lock:
+            self.phases.append({"phase": name, "seconds": 0.0, "at": time.perf_counter() - self.t0, **info})
+
+    def as_dict(self):
+        with self._lock:
+            return [dict(p) for p in self.phases]
+
+    def report(self):
+        lines = ["Startup timing:"]
+        for p in sorted(self.as_dict(), key=lambda p: p["at"]):
+            extra = ", ".join(f"{k}={v}" for k, v in p.items() if k not in ("phase", "seconds", "at"))
+            line = f"  {p['phase']:<36} {p['seconds'] * 1000:8.1f} ms   (t+{p['at']:.2f} s)"
+            lines.append(line + (f"  [{extra}]" if extra else ""))
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+_tf_lock = threading.Lock()
+
+
+def import_tensorflow():
+    """Import TensorFlow once, recording how long it took"""
+    with _tf_lock:
+        import sys
+        if "tensorflow" in sys.modules:
+            return sys.modules["tensorflow"]
+        with STARTUP.phase("import tensorflow"):
+            import tensorflow
+        return tensorflow
+
+
+if __name__ == "__main__":
+    # Measure cold/warm start of one crop model without the GUI:
+    #   python startup.py [Crop]
+    # (imported by name so the timer is the one the loaders record into)
+    import sys
+    import startup
+    from crop_models import CropModelRegistry
+
+    registry = CropModelRegistry()
+    crop = sys.argv[1] if len(sys.argv) > 1 else registry.crops()[0]
+    registry.get(crop)
+    registry.shutdown()
+    print(startup.STARTUP.report())
@@ -0,0 +1,205 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+STAGES = ("capture", "preprocess", "inference", "postprocess", "render", "retrieval", "embedding", "llm")
+LOG_DIR = "logs"
+
+
+class _NullSpan():
+    """What span() returns while telemetry is disabled: does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span():
+    def __init__(self, telemetry, stage, fields):
+        self.telemetry = telemetry
+        self.stage = stage
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        self.telemetry.record(self.stage, time.perf_counter() - self.start, **self.fields)
+        return False
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, default=str)
+
+
+class Telemetry():
+    """Per-stage latency histograms and a structured JSONL event log.
+
+    span(stage) times a block; record() adds a measured duration. Each
+    stage keeps its last `window` samples for p50/p95/p99, and every sample
+    is also logged as one JSON line to log_dir/agrivision_YYYYMMDD.log. The
+    log is written by a background thread through a RotatingFileHandler,
+    so callers only pay for a non-blocking queue put of a dict (events are
+    dropped and counted if the writer falls behind). When disabled, span()
+    returns a shared no-op object and record() returns immediately.
+    """
+
+    def __init__(self, enabled=False, log_dir=LOG_DIR, max_bytes=10 * 1024 * 1024, backups=5,
+                 window=2048, queue_size=10000):
+        self.enabled = enabled
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.window = window
+        self.queue_size = queue_size
+
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._file_handler = None
+        self.path = None
+        self.dropped = 0
+        if enabled:
+            self._start_writer()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv("MINORI_TELEMETRY", "0") not in ("0", ""),
+            log_dir=os.getenv("MINORI_TELEMETRY_DIR", LOG_DIR),
+            max_bytes=int(float(os.getenv("MINORI_TELEMETRY_MAX_MB", 10)) * 1024 * 1024),
+        )
+
+    def _start_writer(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = os.path.join(self.log_dir, time.strftime("agrivision_%Y%m%d.log"))
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True)
+        file_handler.setFormatter(_JsonFormatter())
+
+        self._file_handler = file_handler
+        self.path = path
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._writer = threading.Thread(target=self._write_loop, name="minori-telemetry", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _write_loop(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            self._file_handler.handle(logging.makeLogRecord({"msg": event, "levelno": logging.INFO}))
+
+    def span(self, stage, **fields):
+        """Context manager timing a block as one sample of stage"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, fields)
+
+    def record(self, stage, seconds, **fields):
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+        self.event(stage, ms=round(seconds * 1000, 3), **fields)
+
+    def event(self, name, **fields):
+        """Log a structured event with no histogram sample"""
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait({"ts": round(time.time(), 3), "event": name,
+                                    "thread": threading.current_thread().name, **fields})
+        except queue.Full:
+            self.dropped += 1
+
+    def summary(self, stages=None):
+        """{stage: {count, p50_ms, p95_ms, p99_ms, max_ms}} over the recent window"""
+        with self._lock:
+            snapshot = {stage: (self._counts[stage], list(samples)) for stage, samples in self._samples.items()}
+        return summarize(snapshot, stages)
+
+    def close(self):
+        """Write out queued events and close the log file"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._file_handler.close()
+
+
+def summarize(samples, stages=None):
+    """Percentiles for {stage: (count, [seconds, ...])}, in STAGES order first"""
+    order = list(stages or STAGES) + sorted(s for s in samples if s not in (stages or STAGES))
+    result = {}
+    for stage in order:
+        if stage not in samples or not samples[stage][1]:
+            continue
+        count, values = samples[stage]
+        p50, p95, p99 = np.percentile(np.asarray(values) * 1000, (50, 95, 99))
+        result[stage] = {"count": count, "p50_ms": float(p50), "p95_ms": float(p95),
+                         "p99_ms": float(p99), "max_ms": float(max(values) * 1000)}
+    return result
+
+
+def format_summary(summary):
+    lines = [f"{'stage':<12} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for stage, s in summary.items():
+        lines.append(f"{stage:<12} {s['count']:>7} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+                     f"{s['p99_ms']:>9.2f} {s['max_ms']:>9.2f}")
+    return "\n".join(lines)
+
+
+def read_logs(paths):
+    """{stage: (count, [seconds])} from JSONL telemetry logs"""
+    samples = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if "ms" in event:
+                    samples.setdefault(event["event"], []).append(event["ms"] / 1000)
+    return {stage: (len(values), values) for stage, values in samples.items()}
+
+
+TELEMETRY = Telemetry.from_env()
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Per-stage latency percentiles from telemetry logs")
+    parser.add_argument("paths", nargs="*", help=f"log files (default: {LOG_DIR}/agrivision_*.log*)")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(LOG_DIR, "agrivision_*.log*")))
+    print(format_summary(summarize(read_logs(paths))))
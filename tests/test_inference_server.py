@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from inference_server import InferenceService, make_server
+from preprocess import FramePreprocessor
+
+LABELS = ["Blast", "Healthy", "Brown Spot"]
+
+
+class StubEngine():
+    """predict_batch that records batch sizes and can be held until released"""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def predict_batch(self, batch):
+        self.batches.append(len(batch))
+        self.entered.set()
+        assert self.gate.wait(10)
+        # Probabilities follow the mean red level, so each image gets its own answer
+        red = batch[..., 0].mean(axis=(1, 2))
+        probs = np.stack([red, 1 - red, np.full_like(red, 0.1)], axis=1)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+
+class StubRegistry():
+    """Just the part of CropModelRegistry the service uses, with one crop and no models"""
+
+    def __init__(self):
+        self.engine = StubEngine()
+        self.detector = SimpleNamespace(engine=self.engine, class_labels=LABELS,
+                                        preprocessor=FramePreprocessor((32, 32)))
+
+    def crops(self):
+        return ["Rice"]
+
+    def get(self, crop):
+        if crop != "Rice":
+            raise KeyError(crop)
+        return self.detector
+
+    def stats(self):
+        return {"loaded": ["Rice"]}
+
+
+def png(red=200):
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    frame[..., 2] = red
+    return cv2.imencode(".png", frame)[1].tobytes()
+
+
+def post(url, data):
+    """(status, headers, json body) without raising on HTTP errors"""
+    request = urllib.request.Request(url, data=data, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.headers, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, json.loads(e.read())
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def serve():
+    """Start a server on an ephemeral port; returns (base url, service, registry)"""
+    servers = []
+
+    def start(max_batch=8, max_wait=0.005, max_queue=64):
+        registry = StubRegistry()
+        service = InferenceService(registry, max_batch, max_wait, max_queue)
+        server = make_server(service, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, registry))
+        return f"http://127.0.0.1:{server.server_address[1]}", service, registry
+
+    yield start
+    for server, registry in servers:
+        registry.engine.gate.set()
+        server.shutdown()
+        server.server_close()
+
+
+def test_predict_returns_probabilities(serve):
+    url, _, _ = serve()
+    status, _, body = post(f"{url}/predict/Rice", png(red=250))
+    assert status == 200
+    assert body["crop"] == "Rice"
+    assert body["label"] == "Blast"
+    assert set(body["probs"]) == set(LABELS)
+    assert sum(body["probs"].values()) == pytest.approx(1.0)
+    assert body["confidence"] == pytest.approx(body["probs"]["Blast"])
+    assert body["batch_size"] == 1
+    assert body["latency_ms"] > 0
+
+    status, _, body = post(f"{url}/predict/Rice", png(red=10))
+    assert status == 200 and body["label"] == "Healthy"
+
+
+def test_unknown_crop_is_404(serve):
+    url, _, _ = serve()
+    status, _, body = post(f"{url}/predict/Banana", png())
+    assert status == 404
+    assert body["crops"] == ["Rice"]
+
+
+def test_undecodable_body_is_400(serve):
+    url, _, registry = serve()
+    status, _, body = post(f"{url}/predict/Rice", b"not an image")
+    assert status == 400
+    assert "decode" in body["error"]
+    assert registry.engine.batches == []
+
+
+def test_full_queue_is_503_with_retry_after(serve):
+    url, service, registry = serve(max_queue=2)
+    engine = registry.engine
+    engine.gate.clear()
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        # One request held inside the model, two more filling the queue
+        held = [pool.submit(post, f"{url}/predict/Rice", png())]
+        assert engine.entered.wait(10)
+        held += [pool.submit(post, f"{url}/predict/Rice", png()) for _ in range(2)]
+        wait_for(lambda: service.batcher("Rice").depth() == 2)
+
+        status, headers, body = post(f"{url}/predict/Rice", png())
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+        assert "full" in body["error"]
+
+        engine.gate.set()
+        assert [future.result()[0] for future in held] == [200, 200, 200]
+
+    assert get(f"{url}/metrics")["crops"]["Rice"]["rejected"] == 1
+
+
+def test_concurrent_clients_are_batched(serve):
+    url, service, registry = serve(max_batch=8, max_wait=0.05)
+    engine = registry.engine
+    engine.gate.clear()
+    clients = 12
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        first = pool.submit(post, f"{url}/predict/Rice", png())
+        assert engine.entered.wait(10)
+        rest = [pool.submit(post, f"{url}/predict/Rice", png(red=20 * i)) for i in range(clients - 1)]
+        wait_for(lambda: service.batcher("Rice").depth() == clients - 1)
+        engine.gate.set()
+        results = [first.result()] + [future.result() for future in rest]
+
+    assert [status for status, _, _ in results] == [200] * clients
+    assert max(body["batch_size"] for _, _, body in results) > 1
+    assert max(engine.batches) > 1
+    assert max(engine.batches) <= 8
+    assert sum(engine.batches) == clients
+
+
+def test_metrics_report_batch_sizes_and_latency(serve):
+    url, service, registry = serve(max_batch=4, max_wait=0.05)
+    registry.engine.gate.clear()
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(post, f"{url}/predict/Rice", png())]
+        assert registry.engine.entered.wait(10)
+        futures += [pool.submit(post, f"{url}/predict/Rice", png()) for _ in range(4)]
+        wait_for(lambda: service.batcher("Rice").depth() == 4)
+        registry.engine.gate.set()
+        assert all(future.result()[0] == 200 for future in futures)
+
+    metrics = get(f"{url}/metrics")
+    assert metrics["max_batch"] == 4
+    assert metrics["models"] == {"loaded": ["Rice"]}
+    rice = metrics["crops"]["Rice"]
+    assert rice["requests"] == 5
+    assert rice["rejected"] == rice["errors"] == 0
+    assert rice["queue_depth"] == 0
+    assert rice["batch_sizes"] == {"1": 1, "4": 1}
+    latency = rice["latency_ms"]
+    assert set(latency) == {"p50", "p95", "p99"}
+    assert 0 < latency["p50"] <= latency["p95"] <= latency["p99"]
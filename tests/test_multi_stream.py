@@ -0,0 +1,150 @@
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from camera import SyntheticSource
+from multi_stream import CrossStreamScheduler, Stream, StreamSpec, parse_streams
+from preprocess import FramePreprocessor
+
+# A frame's red level picks its class, so a result shows whose frame it was
+LEVELS = (0, 100, 200)
+GREEN = {"Rice": 0, "Wheat": 255}
+
+
+class StubEngine():
+    """One-hot on the class nearest the mean red level; records every batch"""
+
+    def __init__(self, crop, delay=0.01):
+        self.crop = crop
+        self.delay = delay
+        self.batches = []
+        self.foreign = 0
+
+    def predict_batch(self, batch):
+        red = batch[..., 0].mean(axis=(1, 2)) * 255
+        green = batch[..., 1].mean(axis=(1, 2)) * 255
+        self.batches.append(len(batch))
+        self.foreign += int(np.sum(np.abs(green - GREEN[self.crop]) > 20))
+        time.sleep(self.delay)
+        nearest = np.abs(red[:, None] - np.array(LEVELS)[None, :]).argmin(axis=1)
+        return np.eye(len(LEVELS), dtype=np.float32)[nearest]
+
+
+class StubRegistry():
+    def __init__(self, crops=("Rice", "Wheat")):
+        self.detectors = {
+            crop: SimpleNamespace(engine=StubEngine(crop), preprocessor=FramePreprocessor((16, 16)),
+                                  class_labels=[f"{crop}-{level}" for level in LEVELS])
+            for crop in crops
+        }
+
+    def get(self, crop):
+        return self.detectors[crop]
+
+
+def solid(crop, level, width=64, height=48):
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    frame[..., 1] = GREEN[crop]
+    frame[..., 2] = level
+    return frame
+
+
+def synthetic_stream(name, crop, level, scheduler):
+    frame = solid(crop, level)
+    source = SyntheticSource(64, 48, fps=30, generator=lambda n: frame)
+    return Stream(StreamSpec(name, "synthetic", crop), scheduler, source, gate=False)
+
+
+def run(streams, scheduler, seconds=1.5):
+    for stream in streams:
+        stream.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not all(stream.result for stream in streams) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        time.sleep(seconds)
+    finally:
+        for stream in streams:
+            stream.stop()
+        scheduler.stop()
+
+
+@pytest.fixture
+def registry():
+    return StubRegistry()
+
+
+def test_streams_on_one_crop_share_batches(registry):
+    scheduler = CrossStreamScheduler(registry, max_batch=8, max_wait=0.05)
+    streams = [synthetic_stream(f"cam{i}", "Rice", level, scheduler) for i, level in enumerate(LEVELS)]
+    run(streams, scheduler)
+
+    assert max(registry.detectors["Rice"].engine.batches) > 1
+    assert scheduler.stats()["mean_batch"] > 1
+    for stream, level in zip(streams, LEVELS):
+        assert stream.error is None
+        assert stream.result.label == f"Rice-{level}"
+
+
+def test_crops_never_share_a_batch(registry):
+    scheduler = CrossStreamScheduler(registry, max_batch=8, max_wait=0.05)
+    streams = [synthetic_stream(f"{crop}{i}", crop, level, scheduler)
+               for crop in ("Rice", "Wheat") for i, level in enumerate(LEVELS[:2])]
+    run(streams, scheduler)
+
+    for crop in ("Rice", "Wheat"):
+        engine = registry.detectors[crop].engine
+        assert engine.batches and engine.foreign == 0
+        assert max(engine.batches) <= 2
+    for stream in streams:
+        assert stream.result.label.startswith(stream.spec.crop + "-")
+
+
+def test_streams_with_the_same_name_are_kept_apart(registry):
+    scheduler = CrossStreamScheduler(registry, max_batch=8, max_wait=0.05)
+    streams = [synthetic_stream("cam", "Rice", level, scheduler) for level in LEVELS[1:]]
+    run(streams, scheduler)
+    assert [stream.result.label for stream in streams] == ["Rice-100", "Rice-200"]
+    # Had one frame replaced the other, they could never be batched together
+    assert max(registry.detectors["Rice"].engine.batches) == 2
+
+
+def test_video_file_stream(registry, tmp_path):
+    path = str(tmp_path / "tray.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    assert writer.isOpened()
+    for _ in range(30):
+        writer.write(solid("Wheat", 200))
+    writer.release()
+
+    scheduler = CrossStreamScheduler(registry, max_batch=8, max_wait=0.05)
+    stream = Stream(parse_streams(f"{path}@Wheat")[0], scheduler, gate=False)
+    run([stream], scheduler, seconds=0.2)
+    assert stream.error is None
+    assert stream.result.label == "Wheat-200"
+    assert stream.result.batch_size == 1
+
+
+def test_parse_streams():
+    assert parse_streams("0@Rice, trays.mp4@Wheat") == [
+        StreamSpec("stream0", "0", "Rice"), StreamSpec("stream1", "trays.mp4", "Wheat")]
+    assert parse_streams("field=rtsp://admin:pw@10.0.0.5:554/live@Maize, porch=1@Rice") == [
+        StreamSpec("field", "rtsp://admin:pw@10.0.0.5:554/live", "Maize"), StreamSpec("porch", "1", "Rice")]
+    # Without @crop, the user@host part of a URL is not taken for a crop
+    assert parse_streams("rtsp://admin:pw@10.0.0.5/live,rtsp://admin:pw@cam.local", "Rice") == [
+        StreamSpec("stream0", "rtsp://admin:pw@10.0.0.5/live", "Rice"),
+        StreamSpec("stream1", "rtsp://admin:pw@cam.local", "Rice")]
+    assert parse_streams("http://cam/video?size=large@Wheat") == [
+        StreamSpec("stream0", "http://cam/video?size=large", "Wheat")]
+    assert parse_streams("") == []
+
+
+def test_parse_streams_rejects_bad_input():
+    with pytest.raises(ValueError, match="no crop"):
+        parse_streams("0,1@Rice")
+    with pytest.raises(ValueError, match="duplicate"):
+        parse_streams("cam=0@Rice,cam=1@Rice")
+    with pytest.raises(ValueError, match="duplicate"):
+        parse_streams("0@Rice,stream0=1@Rice")
@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+import pytest
+from prediction_cache import PredictionCache, dhash
+
+
+def leaf(lesions=0, seed=0):
+    """128x128 model input of a green leaf on soil, with `lesions` 4-px brown spots"""
+    image = np.full((128, 128, 3), (60, 90, 120), dtype=np.uint8)
+    cv2.ellipse(image, (64, 64), (50, 28), 30, 0, 360, (40, 160, 50), -1)
+    rng = np.random.default_rng(seed)
+    for _ in range(lesions):
+        x, y = rng.integers(44, 84, 2)
+        cv2.rectangle(image, (int(x), int(y)), (int(x) + 3, int(y) + 3), (40, 60, 110), -1)
+    # Light falling off to the left, so no two neighbouring hash cells tie
+    shading = np.linspace(0.7, 1.0, 128, dtype=np.float32)[None, :, None]
+    return np.round(image * shading) / np.float32(255.0)
+
+
+def test_identical_frame_hits():
+    cache = PredictionCache()
+    cache.put("Rice", 1, cache.hash(leaf()), np.array([0.1, 0.9]))
+    np.testing.assert_array_equal(cache.get("Rice", 1, cache.hash(leaf())), [0.1, 0.9])
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("lesions", [1, 3, 5])
+def test_leaf_with_small_lesions_misses(lesions):
+    cache = PredictionCache()
+    cache.put("Rice", 1, cache.hash(leaf()), np.array([0.0, 1.0]))
+    for seed in range(20):
+        assert cache.get("Rice", 1, cache.hash(leaf(lesions, seed))) is None, seed
+    assert cache.stats()["misses"] == 20
+
+
+def test_entries_are_per_crop_and_model_version():
+    cache = PredictionCache()
+    image_hash = cache.hash(leaf())
+    cache.put("Rice", 1, image_hash, np.array([1.0, 0.0]))
+    assert cache.get("Wheat", 1, image_hash) is None
+    assert cache.get("Rice", 2, image_hash) is None
+    assert cache.invalidate("Rice", keep_version=2) == 1
+    assert cache.get("Rice", 1, image_hash) is None
+
+
+def test_near_hits_are_opt_in():
+    darker = leaf() * np.float32(0.97)
+    assert PredictionCache().hash(darker) != PredictionCache().hash(leaf())
+
+    cache = PredictionCache(max_distance=8)
+    assert cache.hash(leaf()) == dhash(leaf(), 16)
+    cache.put("Rice", 1, cache.hash(leaf()), np.array([0.2, 0.8]))
+    assert cache.get("Rice", 1, cache.hash(darker)) is not None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 0
@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+import pytest
+from preprocess import INPUT_SIZE, FramePreprocessor, load_frame
+
+tf = pytest.importorskip("tensorflow")
+
+
+def keras_input(path, target_size=INPUT_SIZE):
+    """What the detectors did before FramePreprocessor: load_img + img_to_array / 255"""
+    img = tf.keras.utils.load_img(path, target_size=target_size)
+    return np.expand_dims(tf.keras.utils.img_to_array(img) / 255.0, axis=0)
+
+
+def synthetic_frames(seed=0):
+    """BGR frames of several shapes: noise, gradients and a few hard edges"""
+    rng = np.random.default_rng(seed)
+    frames = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+              for h, w in ((480, 640), (720, 1280), (100, 90), (128, 128), (129, 257))]
+    gradient = np.zeros((360, 480, 3), dtype=np.uint8)
+    gradient[..., 0] = np.linspace(0, 255, 480, dtype=np.uint8)
+    gradient[..., 1] = np.linspace(0, 255, 360, dtype=np.uint8)[:, None]
+    cv2.circle(gradient, (240, 180), 90, (0, 0, 255), -1)
+    cv2.rectangle(gradient, (20, 20), (120, 300), (255, 255, 255), -1)
+    frames.append(gradient)
+    return frames
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    """Each synthetic frame written as a lossless PNG, as the old temp-file path did"""
+    paths = []
+    for i, frame in enumerate(synthetic_frames()):
+        path = str(tmp_path / f"frame{i}.png")
+        cv2.imwrite(path, frame)
+        paths.append((path, frame))
+    return paths
+
+
+def test_matches_keras_load_img(image_files):
+    preprocessor = FramePreprocessor()
+    for path, frame in image_files:
+        expected = keras_input(path)
+        actual = preprocessor.preprocess(frame)
+        assert actual.shape == expected.shape == (1,) + INPUT_SIZE + (3,)
+        assert actual.dtype == np.float32
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-6, err_msg=path)
+
+
+def test_grayscale_and_alpha_frames(tmp_path):
+    rng = np.random.default_rng(1)
+    gray = rng.integers(0, 256, (300, 400), dtype=np.uint8)
+    path = str(tmp_path / "gray.png")
+    cv2.imwrite(path, gray)
+
+    preprocessor = FramePreprocessor()
+    expected = keras_input(path)
+    np.testing.assert_allclose(preprocessor.preprocess(gray), expected, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(preprocessor.preprocess(load_frame(path)), expected, rtol=0, atol=1e-6)
+
+    bgra = cv2.cvtColor(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), cv2.COLOR_BGR2BGRA)
+    np.testing.assert_allclose(preprocessor.preprocess(bgra), expected, rtol=0, atol=1e-6)
+
+
+def test_batch_matches_single_frames(image_files):
+    preprocessor = FramePreprocessor()
+    frames = [frame for _, frame in image_files]
+    batch = FramePreprocessor().preprocess_batch(frames)
+    for i, frame in enumerate(frames):
+        np.testing.assert_array_equal(batch[i], preprocessor.preprocess(frame)[0])
+
+
+def test_same_top1_as_keras_path(image_files):
+    from benchmarks import synthetic_model
+
+    model = synthetic_model(6)
+    preprocessor = FramePreprocessor()
+    for path, frame in image_files:
+        expected = model(keras_input(path), training=False).numpy()
+        actual = model(preprocessor.preprocess(frame), training=False).numpy()
+        assert np.argmax(actual) == np.argmax(expected), path
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-5)
@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+import pytest
+from renderer import OverlayCache, draw_detection_overlay
+
+
+def composite(base, layer):
+    out = base.copy()
+    if layer is not None:
+        rgb, mask, (y0, y1, x0, x1) = layer
+        np.copyto(out[y0:y1, x0:x1], rgb, where=mask)
+    return out
+
+
+def reference(base, is_healthy, frame_size, out_size):
+    """Draw on a full-size canvas, scale it and paste every non-black pixel"""
+    canvas = np.zeros(frame_size[::-1] + (3,), dtype=np.uint8)
+    draw_detection_overlay(canvas, is_healthy)
+    canvas = cv2.cvtColor(cv2.resize(canvas, out_size, interpolation=cv2.INTER_NEAREST), cv2.COLOR_BGR2RGB)
+    out = base.copy()
+    drawn = canvas.any(axis=2)
+    out[drawn] = canvas[drawn]
+    return out
+
+
+@pytest.mark.parametrize("out_size", [(640, 480), (800, 600), (320, 240), (97, 53), (20, 15), (8, 6), (2, 2)])
+@pytest.mark.parametrize("is_healthy", [True, False])
+def test_overlay_matches_full_frame_composite(is_healthy, out_size):
+    base = np.random.default_rng(0).integers(0, 256, out_size[::-1] + (3,), dtype=np.uint8)
+    layer = OverlayCache().get(is_healthy, (640, 480), out_size)
+    np.testing.assert_array_equal(composite(base, layer), reference(base, is_healthy, (640, 480), out_size))
+
+
+def test_overlay_scaled_away_is_none():
+    assert OverlayCache().get(True, (640, 480), (8, 6)) is None
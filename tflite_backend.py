@@ -0,0 +1,247 @@
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from preprocess import FramePreprocessor, load_frame
+from startup import STARTUP, import_tensorflow
+
+
+VARIANTS = ("float32", "float16", "int8")
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.bmp")
+
+
+def tflite_path(spec, variant):
+    """Where the exported variant of a crop model lives (next to the .h5)"""
+    stem = os.path.splitext(os.path.basename(spec.model_path))[0]
+    return os.path.join(spec.directory, f"{stem}.{variant}.tflite")
+
+
+def list_images(folder, limit=None):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(folder, "**", pattern), recursive=True))
+    return paths[:limit] if limit else paths
+
+
+def folder_dataset(folder, limit=200, target_size=(128, 128)):
+    """Representative dataset for int8 calibration: preprocessed images from folder.
+
+    Returns a zero-argument callable producing [batch] lists, which is what
+    TFLiteConverter.representative_dataset expects.
+    """
+    paths = list_images(folder, limit)
+    if not paths:
+        raise ValueError(f"No calibration images found in {folder}")
+
+    def generate():
+        preprocessor = FramePreprocessor(target_size)
+        for path in paths:
+            yield [preprocessor.preprocess(load_frame(path)).copy()]
+
+    return generate
+
+
+def _load_interpreter(num_threads, **kwargs):
+    """Prefer the standalone LiteRT/tflite runtimes; fall back to TensorFlow"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = import_tensorflow().lite.Interpreter
+    return Interpreter(num_threads=num_threads, **kwargs)
+
+
+def export_tflite(model, out_path, variant="float16", representative_dataset=None):
+    """Convert a Keras (or cached SavedModel) classifier to a TFLite file.
+
+    variant is one of VARIANTS. int8 needs representative_dataset (see
+    folder_dataset) to calibrate activation ranges; its inputs and outputs
+    stay float32 so the runtime API is the same for every variant.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown TFLite variant '{variant}', expected one of {VARIANTS}")
+    if variant == "int8" and representative_dataset is None:
+        raise ValueError("int8 export needs a representative dataset for calibration")
+
+    from model_cache import CachedModel, convert_model
+    tf = import_tensorflow()
+
+    tmp = None
+    if isinstance(model, CachedModel):
+        saved_model = model.path
+    else:
+        tmp = tempfile.mkdtemp(prefix="minori_export_")
+        saved_model = os.path.join(tmp, "model")
+        convert_model(model, out_path, "", saved_model)
+
+    try:
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model)
+        if variant == "float16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif variant == "int8":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        flatbuffer = converter.convert()
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(out_path + ".tmp", "wb") as f:
+        f.write(flatbuffer)
+    os.replace(out_path + ".tmp", out_path)
+    return out_path
+
+
+class TFLiteEngine():
+    """Run a TFLite classifier with the same API as InferenceEngine"""
+
+    def __init__(self, path, num_threads=None, name="model", warmup=True, max_batch=64):
+        self.path = path
+        self.name = name
+        self.max_batch = max_batch
+        self.num_threads = num_threads or os.cpu_count()
+
+        with STARTUP.phase(f"load {os.path.basename(path)}"):
+            self.interpreter = _load_interpreter(self.num_threads, model_path=path)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in self._input["shape"][1:])
+        self._batch_size = None
+        # An interpreter holds its tensors internally, so calls are serialised
+        self._lock = threading.Lock()
+
+        if warmup:
+            with STARTUP.phase(f"{name} warm-up inference"):
+                self.predict(np.zeros((1,) + self.input_shape, dtype=np.float32))
+
+    def count_params(self):
+        return os.path.getsize(self.path) // 4
+
+    def _invoke(self, batch):
+        if self._batch_size != len(batch):
+            self.interpreter.resize_tensor_input(self._input["index"], [len(batch)] + list(self.input_shape))
+            self.interpreter.allocate_tensors()
+            self._batch_size = len(batch)
+
+        dtype = self._input["dtype"]
+        if dtype != np.float32:
+            scale, zero_point = self._input["quantization"]
+            batch = np.clip(np.round(batch / scale + zero_point), np.iinfo(dtype).min, np.iinfo(dtype).max).astype(dtype)
+        self.interpreter.set_tensor(self._input["index"], batch)
+        self.interpreter.invoke()
+
+        out = self.interpreter.get_tensor(self._output["index"])
+        if self._output["dtype"] != np.float32:
+            scale, zero_point = self._output["quantization"]
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out.copy()
+
+    def predict(self, batch):
+        """Class probabilities for an (N, H, W, 3) float32 batch, shape (N, C)"""
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if len(batch) <= self.max_batch:
+                return self._invoke(batch)
+            return np.concatenate([
+                self._invoke(batch[i:i + self.max_batch])
+                for i in range(0, len(batch), self.max_batch)
+            ])
+
+    def predict_one(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim == 3:
+            x = x[None]
+        return self.predict(x)[0]
+
+    def predict_batch(self, batch):
+        return self.predict(batch)
+
+
+def check_accuracy(spec, folder, variants=VARIANTS, num_threads=None, limit=None, batch_size=32):
+    """Top-1 agreement of each exported TFLite variant with the Keras model"""
+    from inference_engine import InferenceEngine
+    tf = import_tensorflow()
+
+    paths = list_images(folder, limit)
+    if not paths:
+        raise ValueError(f"No images found in {folder}")
+
+    reference = InferenceEngine(tf.keras.models.load_model(spec.model_path, compile=False), name=spec.crop)
+    engines = {"keras": reference}
+    for variant in variants:
+        path = tflite_path(spec, variant)
+        if os.path.exists(path):
+            engines[variant] = TFLiteEngine(path, num_threads, name=f"{spec.crop} {variant}")
+        else:
+            print(f"[WARN] {path} not found, skipping {variant}")
+
+    preprocessor = FramePreprocessor(reference.input_shape[:2])
+    top1 = {name: [] for name in engines}
+    seconds = {name: 0.0 for name in engines}
+    for i in range(0, len(paths), batch_size):
+        batch = preprocessor.preprocess_batch([load_frame(p) for p in paths[i:i + batch_size]])
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            probs = engine.predict(batch)
+            seconds[name] += time.perf_counter() - start
+            top1[name].append(np.argmax(probs, axis=1))
+
+    expected = np.concatenate(top1["keras"])
+    report = {}
+    for name in engines:
+        labels = np.concatenate(top1[name])
+        report[name] = {
+            "agreement": float(np.mean(labels == expected)),
+            "ms_per_image": seconds[name] * 1000 / len(paths),
+            "size_mb": os.path.getsize(spec.model_path if name == "keras" else tflite_path(spec, name)) / 1e6,
+        }
+
+    print(f"{spec.crop}: {len(paths)} images from {folder}")
+    print(f"  {'variant':<8} {'top-1 agree':>11} {'ms/image':>9} {'size MB':>8}")
+    for name, r in report.items():
+        print(f"  {name:<8} {r['agreement'] * 100:10.2f}% {r['ms_per_image']:9.2f} {r['size_mb']:8.2f}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from crop_models import crop_spec
+
+    parser = argparse.ArgumentParser(description="Export and check quantized TFLite crop models")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="write TFLite variants next to the .h5 model")
+    export.add_argument("crop")
+    export.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    export.add_argument("--calibration", help="folder of leaf images for int8 calibration")
+    export.add_argument("--calibration-limit", type=int, default=200)
+
+    check = sub.add_parser("check", help="compare TFLite variants with the Keras model")
+    check.add_argument("crop")
+    check.add_argument("--images", required=True, help="folder of leaf images")
+    check.add_argument("--threads", type=int)
+    check.add_argument("--limit", type=int)
+
+    args = parser.parse_args()
+    spec = crop_spec(args.crop)
+
+    if args.command == "export":
+        tf = import_tensorflow()
+        model = tf.keras.models.load_model(spec.model_path, compile=False)
+        for variant in args.variants:
+            dataset = None
+            if variant == "int8":
+                if not args.calibration:
+                    print("[WARN] Skipping int8: pass --calibration DIR")
+                    continue
+                dataset = folder_dataset(args.calibration, args.calibration_limit, model.input_shape[1:3])
+            path = export_tflite(model, tflite_path(spec, variant), variant, dataset)
+            print(f"[INFO] Wrote {path} ({os.path.getsize(path) / 1e6:.2f} MB)")
+    else:
+        check_accuracy(spec, args.images, num_threads=args.threads, limit=args.limit)
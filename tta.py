@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from inference_engine import percentiles
+from preprocess import INPUT_SIZE, FramePreprocessor
+from renderer import detection_box
+from telemetry import TELEMETRY
+
+
+VIEWS = ("full", "roi", "tiles", "hflip", "vflip")
+AGGREGATES = ("mean", "max")
+
+
+def parse_views(text):
+    """"roi,tiles,hflip" -> ("roi", "tiles", "hflip"), rejecting unknown names"""
+    views = tuple(v.strip() for v in (text or "").split(",") if v.strip())
+    unknown = [v for v in views if v not in VIEWS]
+    if unknown:
+        raise ValueError(f"unknown TTA views {unknown}, expected some of {VIEWS}")
+    if not any(v in views for v in ("full", "roi", "tiles")):
+        raise ValueError("TTA needs at least one of full, roi or tiles")
+    return views
+
+
+class TestTimeAugmenter():
+    """Build one model batch of views of a frame's detection box.
+
+    Spatial views are "full" (the whole frame, as the plain detector sees
+    it), "roi" (the box drawn by the overlay) and "tiles" (a grid x grid set
+    of overlapping tiles over the ROI). "hflip" and "vflip" add mirrored
+    copies of every spatial view.
+
+    The ROI is resized once into a mosaic sized so that every tile is an
+    exact slice of it at model resolution, and flips are strided copies
+    of the preprocessed views, so the number of resizes does not grow with
+    the grid or the flips. All buffers are allocated once.
+    """
+
+    def __init__(self, target_size=INPUT_SIZE, views=("roi", "tiles", "hflip"), grid=2, overlap=0.25,
+                 interpolation=cv2.INTER_NEAREST_EXACT):
+        views = parse_views(",".join(views))
+        self.target_size = target_size
+        self.views = views
+        self.grid = grid
+        self.overlap = overlap
+
+        h, w = target_size
+        self.stride = (max(1, round(h * (1 - overlap))), max(1, round(w * (1 - overlap))))
+        mosaic_size = (h + (grid - 1) * self.stride[0], w + (grid - 1) * self.stride[1])
+
+        spatial = [name for name in ("full", "roi") if name in views]
+        if "tiles" in views:
+            spatial += [f"tile{r}{c}" for r in range(grid) for c in range(grid)]
+        self.spatial = len(spatial)
+        self.names = list(spatial)
+        for flip in ("hflip", "vflip"):
+            if flip in views:
+                self.names += [f"{name}+{flip}" for name in spatial]
+
+        self._view = FramePreprocessor(target_size, interpolation)
+        self._mosaic = FramePreprocessor(mosaic_size, interpolation)
+        self._mosaic_buffer = np.empty(mosaic_size + (3,), dtype=np.float32)
+        self.batch = np.empty((len(self.names), h, w, 3), dtype=np.float32)
+
+    def prepare(self, frame):
+        """Fill and return the (len(names), H, W, 3) batch for frame"""
+        h, w = self.target_size
+        x1, y1, x2, y2 = detection_box(*frame.shape[:2])
+        roi = frame[y1:y2, x1:x2]
+
+        i = 0
+        if "full" in self.views:
+            self._view.preprocess_into(frame, self.batch[i])
+            i += 1
+        if "roi" in self.views:
+            self._view.preprocess_into(roi, self.batch[i])
+            i += 1
+        if "tiles" in self.views:
+            mosaic = self._mosaic.preprocess_into(roi, self._mosaic_buffer)
+            sy, sx = self.stride
+            for r in range(self.grid):
+                for c in range(self.grid):
+                    self.batch[i] = mosaic[r * sy:r * sy + h, c * sx:c * sx + w]
+                    i += 1
+
+        n = self.spatial
+        if "hflip" in self.views:
+            self.batch[i:i + n] = self.batch[:n, :, ::-1]
+            i += n
+        if "vflip" in self.views:
+            self.batch[i:i + n] = self.batch[:n, ::-1]
+        return self.batch
+
+
+def aggregate(probs, mode="mean"):
+    """Combine (V, C) per-view probabilities into one (C,) distribution"""
+    if mode == "mean":
+        return probs.mean(axis=0)
+    if mode == "max":
+        combined = probs.max(axis=0)
+        return combined / combined.sum()
+    raise ValueError(f"unknown aggregate {mode!r}, expected one of {AGGREGATES}")
+
+
+class TemporalSmoother():
+    """Moving average of the last `window` probability vectors per crop"""
+
+    def __init__(self, window=5):
+        self.window = window
+        self._history = {}
+
+    def update(self, crop, probs):
+        history = self._history.get(crop)
+        if history is None or (history and len(history[-1]) != len(probs)):
+            history = self._history[crop] = deque(maxlen=self.window)
+        history.append(probs)
+        return np.mean(history, axis=0)
+
+    def reset(self, crop=None):
+        if crop is None:
+            self._history.clear()
+        else:
+            self._history.pop(crop, None)
+
+
+class LabelStability():
+    """How often consecutive labels for the same crop change"""
+
+    def __init__(self):
+        self.last = {}
+        self.changes = 0
+        self.pairs = 0
+
+    def update(self, crop, label):
+        if crop in self.last:
+            self.pairs += 1
+            self.changes += self.last[crop] != label
+        self.last[crop] = label
+
+    def flip_rate(self):
+        return self.changes / self.pairs if self.pairs else 0.0
+
+
+class TestTimeAugmentation():
+    """classify() with several views per frame in one model call, plus smoothing.
+
+    The views' probabilities are aggregated (mean or max), then averaged
+    with the previous smoothing - 1 results for the same crop. stats()
+    reports how well the views agree with the combined label, and how
+    often the label flips between consecutive frames for the first view
+    alone (what a single call would have said), the aggregate, and the
+    smoothed result.
+    """
+
+    def __init__(self, views=("roi", "tiles", "hflip"), grid=2, overlap=0.25, mode="mean", smoothing=5,
+                 window=2048):
+        if mode not in AGGREGATES:
+            raise ValueError(f"unknown aggregate {mode!r}, expected one of {AGGREGATES}")
+        self.views = parse_views(",".join(views))
+        self.grid = grid
+        self.overlap = overlap
+        self.mode = mode
+        self.smoother = TemporalSmoother(smoothing)
+
+        self._augmenters = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.agreement = 0.0
+        self.single = LabelStability()
+        self.combined = LabelStability()
+        self.smoothed = LabelStability()
+        self.latencies = deque(maxlen=window)
+
+    def augmenter(self, detector):
+        """One TestTimeAugmenter per input size and interpolation"""
+        key = (detector.preprocessor.target_size, detector.preprocessor.interpolation)
+        augmenter = self._augmenters.get(key)
+        if augmenter is None:
+            augmenter = self._augmenters[key] = TestTimeAugmenter(
+                key[0], self.views, self.grid, self.overlap, key[1])
+        return augmenter
+
+    def predict(self, detector, frame):
+        """(V, C) per-view probabilities for a BGR frame"""
+        augmenter = self.augmenter(detector)
+        with TELEMETRY.span("preprocess", crop=detector.crop, views=len(augmenter.names)):
+            batch = augmenter.prepare(frame)
+        with TELEMETRY.span("inference", crop=detector.crop, backend=detector.backend, batch=len(batch)):
+            return detector.engine.predict_batch(batch)
+
+    def classify(self, detector, frame):
+        """(label, {label: smoothed probability}, {label: this frame's aggregate}).
+
+        The label is the smoothed one; the aggregate is what this frame alone
+        says, which is what should be logged per frame.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            views = self.predict(detector, frame)
+            with TELEMETRY.span("postprocess", crop=detector.crop):
+                combined = aggregate(views, self.mode)
+                smoothed = self.smoother.update(detector.crop, combined)
+                label_index = int(np.argmax(smoothed))
+
+                self.calls += 1
+                self.agreement += float(np.mean(np.argmax(views, axis=1) == np.argmax(combined)))
+                labels = detector.class_labels
+                self.single.update(detector.crop, labels[int(np.argmax(views[0]))])
+                self.combined.update(detector.crop, labels[int(np.argmax(combined))])
+                self.smoothed.update(detector.crop, labels[label_index])
+                self.latencies.append(time.perf_counter() - start)
+            return labels[label_index], dict(zip(labels, smoothed.tolist())), dict(zip(labels, combined.tolist()))
+
+    def reset(self, crop=None):
+        """Forget smoothing history (e.g. when the camera is pointed elsewhere)"""
+        with self._lock:
+            self.smoother.reset(crop)
+
+    def stats(self):
+        with self._lock:
+            augmenter = next(iter(self._augmenters.values()), None)
+            return {
+                "views": augmenter.names if augmenter else [],
+                "aggregate": self.mode,
+                "smoothing": self.smoother.window,
+                "calls": self.calls,
+                "agreement": self.agreement / self.calls if self.calls else 0.0,
+                "flip_rate": {
+                    "single": self.single.flip_rate(),
+                    "aggregate": self.combined.flip_rate(),
+                    "smoothed": self.smoothed.flip_rate(),
+                },
+                "latency_ms": {k: v * 1000 for k, v in percentiles(list(self.latencies), (50, 95)).items()},
+            }
+
+
+def compare(detector, frames, tta):
+    """Run the plain detector and tta over the same frame sequence"""
+    plain = LabelStability()
+    plain_latencies = []
+    agree = 0
+    for frame in frames:
+        start = time.perf_counter()
+        label, _ = detector.classify(frame)
+        plain_latencies.append(time.perf_counter() - start)
+        plain.update(detector.crop, label)
+        agree += tta.classify(detector, frame)[0] == label
+
+    stats = tta.stats()
+    return {
+        "frames": stats["calls"],
+        "plain": {
+            "flip_rate": plain.flip_rate(),
+            "latency_ms": {k: v * 1000 for k, v in percentiles(plain_latencies, (50, 95)).items()},
+        },
+        "tta": stats,
+        "same_label_as_plain": agree / stats["calls"] if stats["calls"] else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from batch_infer import iter_inputs
+    from crop_models import CropDetector, crop_spec
+
+    parser = argparse.ArgumentParser(description="Compare plain and test-time-augmented classification on a "
+                                                 "folder or video")
+    parser.add_argument("crop")
+    parser.add_argument("source", help="directory, glob pattern (quote it), image or video file")
+    parser.add_argument("--views", default="roi,tiles,hflip", help=f"comma-separated, from {', '.join(VIEWS)}")
+    parser.add_argument("--grid", type=int, default=2)
+    parser.add_argument("--overlap", type=float, default=0.25)
+    parser.add_argument("--aggregate", choices=AGGREGATES, default="mean")
+    parser.add_argument("--smoothing", type=int, default=5)
+    parser.add_argument("--stride", type=int, default=1, help="for videos, classify every n-th frame")
+    parser.add_argument("--backend", default="keras", help="keras or tflite-<variant>")
+    args = parser.parse_args()
+
+    detector = CropDetector(crop_spec(args.crop), backend=args.backend)
+    tta = TestTimeAugmentation(parse_views(args.views), args.grid, args.overlap, args.aggregate, args.smoothing)
+    frames = (load() for _, load in iter_inputs(args.source, args.stride))
+    print(json.dumps(compare(detector, frames, tta), indent=2))
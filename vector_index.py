@@ -0,0 +1,373 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from embedding_backends import LEGACY_BACKEND, backend_id
+from retrieval import ChunkTagger
+from telemetry import TELEMETRY
+
+
+MANIFEST = "manifest.json"
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_backend(vectors_dir="Vectors"):
+    """backend_id of the embeddings that built the index in vectors_dir, or None"""
+    path = os.path.join(vectors_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f).get("embeddings", LEGACY_BACKEND)
+    if os.path.exists(os.path.join(vectors_dir, "index.faiss")):
+        return LEGACY_BACKEND
+    return None
+
+
+def split_pdf(path, chunk_size=1000, chunk_overlap=200):
+    """Load and split one PDF; runs in a worker process"""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.split_documents(PyPDFLoader(path).lazy_load())
+
+
+def iter_split(paths, workers=4, chunk_size=1000, chunk_overlap=200):
+    """Yield (path, chunks) as files finish splitting.
+
+    At most 2 * workers files are in flight, so only their chunks are held
+    in memory however many files there are. With workers <= 1 everything
+    runs in this process.
+    """
+    paths = list(paths)
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, split_pdf(path, chunk_size, chunk_overlap)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        todo = iter(paths)
+        running = {}
+        for path in todo:
+            running[pool.submit(split_pdf, path, chunk_size, chunk_overlap)] = path
+            if len(running) >= 2 * workers:
+                break
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = running.pop(future)
+                yield path, future.result()
+                for next_path in todo:
+                    running[pool.submit(split_pdf, next_path, chunk_size, chunk_overlap)] = next_path
+                    break
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_with_retry(embeddings, texts, retries=5, backoff=1.0, max_backoff=60.0):
+    """embeddings.embed_documents(texts), retried with exponential backoff"""
+    delay = backoff
+    for attempt in range(retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"[WARN] Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.1f} s")
+            time.sleep(delay)
+            delay = min(delay * 2, max_backoff)
+
+
+class IngestProgress:
+    """Running totals for an ingestion run, printed every `every` seconds"""
+
+    def __init__(self, total_files, every=5.0):
+        self.total_files = total_files
+        self.every = every
+        self.files = 0
+        self.chunks = 0
+        self.start = time.perf_counter()
+        self._last = self.start
+
+    def update(self, files=0, chunks=0, force=False):
+        self.files += files
+        self.chunks += chunks
+        now = time.perf_counter()
+        if force or now - self._last >= self.every:
+            self._last = now
+            elapsed = max(now - self.start, 1e-9)
+            print(f"[INFO] Ingest: {self.files}/{self.total_files} files, {self.chunks} chunks, "
+                  f"{self.chunks / elapsed:.1f} chunks/s, {self.files / elapsed:.2f} files/s")
+
+
+class IncrementalIndexer:
+    """Keep the FAISS index in vectors_dir in sync with the PDFs in data_dir.
+
+    A manifest next to the index records, per PDF, its size, mtime, content
+    hash and the ids of the chunks it produced. update() only splits and
+    embeds new or changed files, deletes the vectors of removed ones, and
+    writes the result to a temporary directory that is then swapped in for
+    vectors_dir. With nothing changed it only stats the files.
+
+    Changed files are split in a pool of `workers` processes and their
+    chunks streamed through embedding batches of batch_size straight into
+    the index, so memory does not grow with the size of the corpus.
+
+    The manifest also records backend_id(embeddings). If the index was
+    built by a different backend it is rebuilt from scratch rather than
+    mixing vectors from two spaces. Embeddings that need fitting (local
+    ones) are fitted on the corpus first and saved alongside the index.
+    """
+
+    def __init__(self, embeddings, data_dir="Data", vectors_dir="Vectors", chunk_size=1000, chunk_overlap=200,
+                 workers=None, batch_size=64, retries=5, tagger=None):
+        self.embeddings = embeddings
+        self.data_dir = data_dir
+        self.vectors_dir = vectors_dir
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self.retries = retries
+        self.tagger = tagger
+
+    def load_manifest(self):
+        path = os.path.join(self.vectors_dir, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            manifest.setdefault("embeddings", LEGACY_BACKEND)
+            return manifest
+        return {"files": {}}
+
+    def scan(self):
+        """{relative path: os.stat_result} for every PDF under data_dir"""
+        found = {}
+        for dirpath, _, filenames in os.walk(self.data_dir):
+            for name in sorted(filenames):
+                if name.lower().endswith(".pdf"):
+                    path = os.path.join(dirpath, name)
+                    found[os.path.relpath(path, self.data_dir)] = os.stat(path)
+        return found
+
+    def plan(self, manifest, found):
+        """Split files into (new or changed, removed, unchanged) using stat, then hash.
+
+        Unchanged files whose stat moved get their manifest entry refreshed
+        in place; their names are also returned as `touched`.
+        """
+        known = manifest["files"]
+        changed, unchanged, touched = [], [], []
+        for rel, st in found.items():
+            entry = known.get(rel)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                unchanged.append(rel)
+                continue
+            digest = file_sha256(os.path.join(self.data_dir, rel))
+            if entry and entry["sha256"] == digest:
+                # Touched but identical: just refresh the stat fields
+                entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+                unchanged.append(rel)
+                touched.append(rel)
+            else:
+                changed.append((rel, digest))
+        removed = [rel for rel in known if rel not in found]
+        return changed, removed, unchanged, touched
+
+    def adopt_legacy_index(self, store, found):
+        """Build a manifest for an index created before manifests existed.
+
+        Chunks are grouped by the file name in their 'source' metadata (which
+        may be a path from another machine, e.g. 'Backend\\Data\\x.pdf');
+        files still present are assumed to be the ones that were indexed.
+        """
+        by_name = {os.path.basename(rel): rel for rel in found}
+        files = {}
+        for doc_id, doc in store.docstore._dict.items():
+            name = doc.metadata.get("source", "").replace("\\", "/").rsplit("/", 1)[-1]
+            rel = by_name.get(name, name)
+            files.setdefault(rel, {"chunk_ids": []})["chunk_ids"].append(doc_id)
+
+        for rel, entry in files.items():
+            st = found.get(rel)
+            if st is not None:
+                entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns,
+                             sha256=file_sha256(os.path.join(self.data_dir, rel)))
+            else:
+                entry.update(size=-1, mtime_ns=-1, sha256="")
+        return {"files": files, "embeddings": LEGACY_BACKEND}
+
+    def fit_embeddings(self, found, limit=20000):
+        """Fit embeddings on up to `limit` chunks of the whole corpus"""
+        texts = []
+        paths = [os.path.join(self.data_dir, rel) for rel in found]
+        for _, docs in iter_split(paths, self.workers, self.chunk_size, self.chunk_overlap):
+            texts.extend(doc.page_content for doc in docs[:limit - len(texts)])
+            if len(texts) >= limit:
+                break
+        print(f"[INFO] Fitting {type(self.embeddings).__name__} on {len(texts)} chunks")
+        self.embeddings.fit(texts)
+
+    def iter_chunks(self, changed, chunk_ids, progress):
+        """Yield (id, document) for every chunk of the changed files.
+
+        Ids are "<hash of path and content>-<n>" so they stay stable across
+        runs and identical copies of a file do not collide; chunk_ids[rel]
+        collects them per file for the manifest. Chunks are tagged with
+        their crop and diseases for filtered retrieval.
+        """
+        if self.tagger is None:
+            self.tagger = ChunkTagger()
+        digests = {os.path.join(self.data_dir, rel): (rel, digest) for rel, digest in changed}
+        for path, docs in iter_split(digests, self.workers, self.chunk_size, self.chunk_overlap):
+            rel, digest = digests[path]
+            prefix = hashlib.sha256(f"{rel}\0{digest}".encode("utf-8")).hexdigest()[:16]
+            ids = chunk_ids.setdefault(rel, [])
+            for doc in docs:
+                ids.append(f"{prefix}-{len(ids)}")
+                yield ids[-1], self.tagger.tag(doc)
+            progress.update(files=1)
+
+    def index_files(self, store, changed):
+        """Embed and add the chunks of changed files batch by batch; returns (store, {rel: ids})"""
+        chunk_ids = {}
+        progress = IngestProgress(len(changed))
+        for batch in batched(self.iter_chunks(changed, chunk_ids, progress), self.batch_size):
+            ids = [doc_id for doc_id, _ in batch]
+            texts = [doc.page_content for _, doc in batch]
+            metadatas = [doc.metadata for _, doc in batch]
+            with TELEMETRY.span("embedding", texts=len(texts)):
+                vectors = embed_with_retry(self.embeddings, texts, self.retries)
+
+            pairs = list(zip(texts, vectors))
+            if store is None:
+                store = FAISS.from_embeddings(pairs, self.embeddings, metadatas=metadatas, ids=ids)
+            else:
+                store.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+            progress.update(chunks=len(batch))
+
+        if changed:
+            progress.update(force=True)
+        return store, chunk_ids
+
+    def update(self):
+        """Bring the index up to date; returns a summary dict"""
+        start = time.perf_counter()
+        self.recover()
+        found = self.scan()
+        has_index = os.path.exists(os.path.join(self.vectors_dir, "index.faiss"))
+
+        store = None
+        manifest = self.load_manifest()
+        if has_index and not manifest["files"]:
+            store = FAISS.load_local(self.vectors_dir, self.embeddings, allow_dangerous_deserialization=True)
+            manifest = self.adopt_legacy_index(store, found)
+            print(f"[INFO] Adopted existing index ({len(manifest['files'])} files)")
+
+        if getattr(self.embeddings, "needs_fit", False):
+            if not self.embeddings.load(self.vectors_dir) and found:
+                self.fit_embeddings(found)
+        current = backend_id(self.embeddings)
+        if manifest["files"] and manifest.get("embeddings") != current:
+            print(f"[WARN] Index was built with {manifest.get('embeddings')}, rebuilding it with {current}")
+            store, has_index = None, False
+            manifest = {"files": {}}
+        manifest["embeddings"] = current
+
+        changed, removed, unchanged, touched = self.plan(manifest, found)
+        # Files re-indexed because they changed also need their old vectors removed
+        stale = removed + [rel for rel, _ in changed if rel in manifest["files"]]
+        summary = {
+            "added": sum(1 for rel, _ in changed if rel not in manifest["files"]),
+            "changed": sum(1 for rel, _ in changed if rel in manifest["files"]),
+            "removed": len(removed),
+            "unchanged": len(unchanged),
+            "chunks_added": 0,
+            "chunks_removed": 0,
+        }
+
+        if changed or stale:
+            if store is None and has_index:
+                store = FAISS.load_local(self.vectors_dir, self.embeddings, allow_dangerous_deserialization=True)
+
+            old_ids = [i for rel in stale for i in manifest["files"][rel]["chunk_ids"]]
+            old_ids = [i for i in old_ids if store is not None and i in store.docstore._dict]
+            if old_ids:
+                store.delete(old_ids)
+            summary["chunks_removed"] = len(old_ids)
+
+            for rel in removed:
+                del manifest["files"][rel]
+
+            store, chunk_ids = self.index_files(store, changed)
+            for rel, digest in changed:
+                st = found[rel]
+                manifest["files"][rel] = {
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "sha256": digest,
+                    "chunk_ids": chunk_ids.get(rel, []),
+                }
+                summary["chunks_added"] += len(chunk_ids.get(rel, []))
+
+        if changed or stale or not os.path.exists(os.path.join(self.vectors_dir, MANIFEST)):
+            if store is not None or has_index:
+                self.save(store, manifest)
+        elif touched:
+            self.write_manifest(self.vectors_dir, manifest)
+
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+    def recover(self):
+        """Put back the previous index if a save() died between its two renames"""
+        old = self.vectors_dir + ".old"
+        if not os.path.exists(self.vectors_dir) and os.path.isdir(old):
+            print(f"[WARN] {self.vectors_dir} is missing after an interrupted save, restoring {old}")
+            os.rename(old, self.vectors_dir)
+
+    def write_manifest(self, directory, manifest):
+        path = os.path.join(directory, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def save(self, store, manifest):
+        """Write index and manifest to a temp dir, then swap it in for vectors_dir"""
+        tmp = self.vectors_dir + ".tmp"
+        old = self.vectors_dir + ".old"
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        if store is None:
+            # Nothing new to write; carry the existing index files over
+            shutil.copytree(self.vectors_dir, tmp)
+        else:
+            store.save_local(tmp)
+        if hasattr(self.embeddings, "save"):
+            self.embeddings.save(tmp)
+        self.write_manifest(tmp, manifest)
+
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(self.vectors_dir):
+            os.rename(self.vectors_dir, old)
+        os.rename(tmp, self.vectors_dir)
+        shutil.rmtree(old, ignore_errors=True)